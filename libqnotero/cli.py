@@ -0,0 +1,225 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+
+# The command-line interface doesn't import Qt, so that it starts quickly.
+# Results are taken from the indexing daemon or a running Qnotero if there is
+# one, and otherwise from the index that Qnotero stored on disk.
+
+import argparse
+import configparser
+import contextlib
+import json
+import os
+import sys
+import time
+from libqnotero.config import config, configFolder, setConfig
+
+output_formats = u"tsv", u"json", u"dmenu"
+
+
+def load_settings():
+
+    """
+    Reads the settings that the Qnotero GUI stored, if they are in an INI
+    file, which is where Qt stores them on Linux.
+
+    Returns:
+    True if the settings were read, False otherwise.
+    """
+
+    parser = configparser.ConfigParser(interpolation=None)
+    parser.optionxform = str
+    path = os.path.join(configFolder(), u"qnotero.conf")
+    try:
+        if not parser.read(path, encoding=u"utf-8"):
+            return False
+    except configparser.Error as e:
+        print(u"cli.load_settings(): %s" % e, file=sys.stderr)
+        return False
+    if not parser.has_section(u"Qnotero"):
+        return False
+    for setting, value in parser.items(u"Qnotero"):
+        default = config.get(setting)
+        try:
+            if isinstance(default, bool):
+                value = value == u"true"
+            elif isinstance(default, int):
+                value = int(value)
+            elif isinstance(default, float):
+                value = float(value)
+            elif not isinstance(default, str):
+                continue
+        except ValueError:
+            continue
+        setConfig(setting, value)
+    return True
+
+
+def format_result(item, output_format):
+
+    """
+    Arguments:
+    item			--	A dict with the information of an item, as returned by
+                        zoteroItem.as_dict().
+    output_format	--	One of output_formats.
+
+    Returns:
+    A line of output.
+    """
+
+    if output_format == u"json":
+        return json.dumps(item, ensure_ascii=False)
+    authors = item[u"authors"]
+    if not authors:
+        author = u"Unknown author"
+    elif len(authors) >= 3:
+        author = u"%s et al." % authors[0]
+    elif len(authors) == 2:
+        author = u"%s & %s" % tuple(authors)
+    else:
+        author = authors[0]
+    date = item[u"date"] or u"Date unknown"
+    if output_format == u"dmenu":
+        line = u"%s (%s) %s" % (author, date, item[u"title"] or u"")
+        if item[u"publication"]:
+            line += u" - %s" % item[u"publication"]
+        return line.replace(u"\n", u" ")
+    fields = [item[u"key"], author, date, item[u"title"],
+              item[u"publication"], item[u"doi"],
+              (item[u"attachments"] or [u""])[0]]
+    return u"\t".join(u"" if field is None else
+                      str(field).replace(u"\t", u" ").replace(u"\n", u" ")
+                      for field in fields)
+
+
+def search_server(query, limit):
+
+    """
+    Searches through the indexing daemon or a running Qnotero.
+
+    Arguments:
+    query	--	A search query.
+    limit	--	The maximum number of results, or None for no limit.
+
+    Returns:
+    A (results, matches) tuple, where results is a list of dicts with the
+    information of the items, and matches the number of matching items, or
+    None if neither is running.
+    """
+
+    from libqnotero.listener import send
+    args = {u"query": query}
+    if limit is not None:
+        args[u"limit"] = limit
+    for server in (u"daemon", u"qnotero"):
+        try:
+            response = send(u"search", timeout=10., server=server, **args)
+        except (OSError, ValueError):
+            continue
+        if response.get(u"ok"):
+            return response[u"results"], response[u"count"]
+    return None
+
+
+def search_local(query, limit, zotero_path):
+
+    """
+    Searches the index that Qnotero stored on disk, after bringing it up to
+    date with the Zotero database.
+
+    Arguments:
+    query		--	A search query.
+    limit		--	The maximum number of results, or None for no limit.
+    zotero_path	--	The Zotero folder.
+
+    Returns:
+    A (results, matches) tuple as for search_server(), or None if the index
+    could not be updated.
+    """
+
+    from libzotero.libzotero import LibZotero
+    zotero = LibZotero(zotero_path, autoUpdate=False)
+    if not zotero.update():
+        return None
+    # Only the requested number of results is ranked
+    results = zotero.search_results(query, max_results=limit or 0)
+    if limit is None:
+        items = list(results)
+    else:
+        items = results.fetch(limit)
+    return [item.as_dict() for item in items], results.matches
+
+
+def main(argv=None):
+
+    """
+    Runs a search from the command line.
+
+    Keyword arguments:
+    argv	--	The command-line arguments, or None to use sys.argv.
+                (default=None)
+
+    Returns:
+    The exit status.
+    """
+
+    t = time.time()
+    parser = argparse.ArgumentParser(prog=u"qnotero",
+                                     description=u"Search the Zotero library "
+                                     u"without starting the Qnotero window.")
+    parser.add_argument(u"--query", required=True,
+                        help=u"the search query, as typed in Qnotero")
+    parser.add_argument(u"--format", choices=output_formats, default=u"tsv",
+                        help=u"the output format (default: tsv)")
+    parser.add_argument(u"--limit", type=int, default=None,
+                        help=u"the maximum number of results")
+    parser.add_argument(u"--zotero-path", default=None,
+                        help=u"the Zotero folder (default: the Qnotero "
+                        u"setting)")
+    parser.add_argument(u"--local", action=u"store_true",
+                        help=u"don't ask the daemon or a running Qnotero")
+    parser.add_argument(u"--verbose", action=u"store_true",
+                        help=u"show log messages and timing on stderr")
+    args, _ = parser.parse_known_args(argv)
+    load_settings()
+    zotero_path = args.zotero_path or config[u"zoteroPath"] or \
+        os.path.join(os.path.expanduser(u"~"), u"Zotero")
+    # The libraries log to stdout, which is reserved for results
+    log = sys.stderr if args.verbose else open(os.devnull, u"w")
+    with contextlib.redirect_stdout(log):
+        results = None
+        source = u"server"
+        if not args.local:
+            results = search_server(args.query, args.limit)
+        if results is None:
+            source = u"index"
+            results = search_local(args.query, args.limit, zotero_path)
+    if results is None:
+        print(u"qnotero: failed to read the Zotero library in %s"
+              % zotero_path, file=sys.stderr)
+        return 1
+    results, matches = results
+    for item in results:
+        print(format_result(item, args.format))
+    if args.verbose:
+        print(u"cli.main(): %d of %d results from %s in %.3fs"
+              % (len(results), matches, source, time.time() - t),
+              file=sys.stderr)
+    return 0
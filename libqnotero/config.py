@@ -16,6 +16,7 @@
 #      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
 #      Copyright (c) 2019 E. Albiter
 
+import os
 import platform
 
 config = {
@@ -24,6 +25,7 @@ config = {
     u"cfgVer": 0,
     u"firstRun": True,
     u"listenerPort": 43250,
+    u"listenerSocket": u"",
     u"minQueryLength": 3,
     u"noteProvider": u"gnote",
     u"theme": u"Light",
@@ -31,8 +33,21 @@ config = {
     u"updateUrl": u"",
     u"pos": u"Top right",
     u"zoteroPath": u"",
+    u"zoteroDatabaseMode": u"auto",
     u"mdNoteproviderPath": u"",
     u'showAbstract': False,
+    u"indexCache": True,
+    u"searchCacheMaxEntries": 256,
+    u"searchCacheMaxBytes": 8388608,
+    u"ftCacheIndex": False,
+    u"rankResults": True,
+    u"maxResults": 100,
+    u"resultPageSize": 20,
+    u"useDaemon": False,
+    u"daemonPollInterval": 2,
+    u"watchDatabase": True,
+    u"reindexDelay": 1000,
+    u"reindexMaxDelay": 10000,
     }
 
 
@@ -48,6 +63,23 @@ def getConfig(setting):
     return config[setting]
 
 
+def configFolder():
+
+    """
+    Returns:
+    The folder in which Qnotero stores its settings and cache files
+    """
+
+    if platform.system() == u"Windows":
+        base = os.environ.get(u"APPDATA", os.environ[u"USERPROFILE"])
+    elif platform.system() == u"Darwin":
+        base = os.path.join(os.environ[u"HOME"], u"Library", u"Preferences")
+    else:
+        base = os.environ.get(u"XDG_CONFIG_HOME",
+                              os.path.join(os.environ[u"HOME"], u".config"))
+    return os.path.join(base, u"Qnotero")
+
+
 def setConfig(setting, value):
 
     """
@@ -76,7 +108,9 @@ def restoreConfig(settings):
             if platform.system() == u'Darwin':
                 value = bool(settings.value(setting, default))
             else:
-                value = settings.value(setting, default) == 'true'
+                # Stored values are strings, but settings that haven't been
+                # stored yet have their default value
+                value = settings.value(setting, default) in (True, u'true')
         elif isinstance(default, str):
             value = str(settings.value(setting, default))
         elif isinstance(default, int):
@@ -0,0 +1,190 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+
+# The indexing daemon owns the index of the Zotero library, keeps it up to
+# date, and answers searches from any number of front-ends, so that the index
+# is built and held in memory only once. It doesn't import Qt.
+
+import argparse
+import os
+import signal
+import threading
+import time
+from libqnotero.config import getConfig
+from libqnotero.listener import Listener
+
+
+class Daemon(Listener):
+
+	"""
+	Serves searches from an index that is updated in the background. The
+	daemon checks whether the Zotero database changed every
+	daemonPollInterval seconds, and while it is idle. The daemon runs
+	without Qt, so it cannot use the DatabaseWatcher, but a check only takes
+	a stat() of each of the database files.
+	"""
+
+	def __init__(self, zotero_path):
+
+		"""
+		Constructor
+
+		Arguments:
+		zotero_path -- the Zotero folder
+
+		Raises:
+		OSError if another daemon is already running
+		"""
+
+		from libzotero.libzotero import LibZotero
+		Listener.__init__(self, server=u"daemon")
+		self.timeout = getConfig(u"daemonPollInterval")
+		self.commands.pop(u"activate")
+		self.commands.update({
+			u"status": self.status,
+			u"update": self.update,
+			u"shutdown": self.shutdown,
+			})
+		self.libZotero = LibZotero(zotero_path, autoUpdate=False)
+		self.updater = None
+		self.lastCheck = 0
+		self.startUpdate()
+
+	def zotero(self):
+
+		return self.libZotero
+
+	def idle(self):
+
+		"""Starts an update if the Zotero database has changed"""
+
+		if time.time() - self.lastCheck < self.timeout:
+			return
+		self.lastCheck = time.time()
+		if self.libZotero.needs_update():
+			self.startUpdate()
+
+	def updating(self):
+
+		"""
+		Returns:
+		True if an update is running, False otherwise
+		"""
+
+		return self.updater is not None and self.updater.is_alive()
+
+	def startUpdate(self, force=False):
+
+		"""
+		Updates the index in a background thread, while searches continue
+		to use the current index
+
+		Keyword arguments:
+		force -- indicates that the index should be rebuilt (default=False)
+
+		Returns:
+		True if an update was started, False if one is already running
+		"""
+
+		if self.updating():
+			return False
+		self.updater = threading.Thread(target=self.runUpdate, args=(force,))
+		self.updater.daemon = True
+		self.updater.start()
+		return True
+
+	def runUpdate(self, force):
+
+		"""
+		Updates the index, and then the index of the attachments
+
+		Arguments:
+		force -- indicates that the index should be rebuilt
+		"""
+
+		try:
+			self.libZotero.error = not self.libZotero.update(force)
+			if not self.libZotero.error:
+				self.libZotero.update_ftcache(
+					should_stop=lambda: not self.alive)
+		except Exception as e:
+			print(u"daemon.runUpdate(): failed to update index: %s" % e)
+			self.libZotero.error = True
+
+	def status(self, request):
+
+		"""Describes the index"""
+
+		index = self.libZotero.zotero_index
+		return {u"ok": True, u"pid": os.getpid(),
+			u"zoteroPath": self.libZotero.zotero_path,
+			u"items": len(index.items), u"mtime": index.mtime,
+			u"updating": self.updating(), u"error": self.libZotero.error,
+			u"searches": self.libZotero.searches}
+
+	def update(self, request):
+
+		"""Updates the index, and rebuilds it if force is set"""
+
+		return {u"ok": True,
+			u"started": self.startUpdate(bool(request.get(u"force")))}
+
+	def shutdown(self, request):
+
+		"""Stops the daemon"""
+
+		self.stop()
+		return {u"ok": True}
+
+
+def main(argv=None):
+
+	"""
+	Runs the daemon until it is stopped
+
+	Keyword arguments:
+	argv -- the command-line arguments, or None to use sys.argv
+			(default=None)
+
+	Returns:
+	The exit status
+	"""
+
+	from libqnotero.cli import load_settings
+	parser = argparse.ArgumentParser(prog=u"qnotero",
+		description=u"Index the Zotero library, and serve searches to "
+		u"Qnotero front-ends.")
+	parser.add_argument(u"--daemon", action=u"store_true", required=True)
+	parser.add_argument(u"--zotero-path", default=None,
+		help=u"the Zotero folder (default: the Qnotero setting)")
+	args, _ = parser.parse_known_args(argv)
+	load_settings()
+	zotero_path = args.zotero_path or getConfig(u"zoteroPath") or \
+		os.path.join(os.path.expanduser(u"~"), u"Zotero")
+	try:
+		daemon = Daemon(zotero_path)
+	except OSError as e:
+		print(u"daemon.main(): %s" % e)
+		return 1
+	for signum in (signal.SIGINT, signal.SIGTERM):
+		signal.signal(signum, lambda signum, frame: daemon.stop())
+	daemon.run()
+	print(u"daemon.main(): stopped")
+	return 0
@@ -0,0 +1,413 @@
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+
+import os
+import threading
+import time
+from collections import deque
+from libqnotero.qt.QtCore import QThread, QObject, QTimer, \
+    QFileSystemWatcher, pyqtSignal
+from libqnotero.config import getConfig
+
+
+class Indexer(QThread):
+
+    """Updates the Zotero index in the background"""
+
+    progress = pyqtSignal(int)
+    indexed = pyqtSignal(bool)
+
+    def __init__(self, qnotero, zotero):
+
+        """
+        Constructor
+
+        Arguments:
+        qnotero -- a Qnotero instance
+        zotero -- the LibZotero instance to update
+        """
+
+        QThread.__init__(self, qnotero)
+        self.qnotero = qnotero
+        self.zotero = zotero
+        self.force = False
+        self.pending = False
+        self.finished.connect(self._finished)
+
+    def refresh(self, force=False):
+
+        """
+        Starts an update if the Zotero database has changed. If an update is
+        already running, another one is started once it has finished.
+
+        Keyword arguments:
+        force -- indicates that the index should be rebuilt even if the
+                 database hasn't changed (default=False)
+        """
+
+        if self.isRunning():
+            self.pending = True
+            self.force = self.force or force
+            return
+        if not force and not self.zotero.needs_update():
+            return
+        self.force = force
+        self.start()
+
+    def run(self):
+
+        """Updates the index"""
+
+        try:
+            success = self.zotero.update(self.force,
+                                         progress=self.progress.emit)
+        except Exception as e:
+            print(u"indexer.run(): failed to update index: %s" % e)
+            success = False
+        self.zotero.error = not success
+        self.indexed.emit(success)
+
+    def _finished(self):
+
+        """Starts the update that was requested while updating"""
+
+        if self.pending:
+            self.pending = False
+            self.refresh(self.force)
+
+
+class DatabaseWatcher(QObject):
+
+    """
+    Watches the Zotero database, and its write-ahead log and journal, for
+    changes. Zotero writes in bursts, so the index is only updated once no
+    changes have been made for reindexDelay milliseconds, or once
+    reindexMaxDelay milliseconds have passed since the first change.
+    """
+
+    def __init__(self, qnotero, zotero, indexer):
+
+        """
+        Constructor
+
+        Arguments:
+        qnotero -- a Qnotero instance
+        zotero -- the LibZotero instance whose database is watched
+        indexer -- the Indexer that updates the index
+        """
+
+        QObject.__init__(self, qnotero)
+        self.zotero = zotero
+        self.indexer = indexer
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.indexer.refresh)
+        # The time of the first change since the last update
+        self.firstChange = None
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self.changed)
+        self.watcher.directoryChanged.connect(self.changed)
+        self.watch()
+
+    def watch(self):
+
+        """
+        Watches the database files that exist, and the folder in which the
+        write-ahead log and the journal are created and removed
+        """
+
+        paths = [path for path in self.zotero.database_files()
+                 if os.path.exists(path)]
+        if paths:
+            paths.append(os.path.dirname(paths[0]))
+        watched = set(self.watcher.files() + self.watcher.directories())
+        paths = [path for path in paths if path not in watched]
+        if paths:
+            self.watcher.addPaths(paths)
+
+    def changed(self, path):
+
+        """
+        Schedules an update, or postpones it if one is already scheduled
+
+        Arguments:
+        path -- the path that changed
+        """
+
+        # Files that are replaced or removed are no longer watched
+        self.watch()
+        now = time.monotonic()
+        if not self.timer.isActive():
+            self.firstChange = now
+        remaining = getConfig(u"reindexMaxDelay") - \
+            int((now - self.firstChange) * 1000)
+        self.timer.start(max(0, min(getConfig(u"reindexDelay"), remaining)))
+
+    def stop(self):
+
+        """Stops watching"""
+
+        self.timer.stop()
+        paths = self.watcher.files() + self.watcher.directories()
+        if paths:
+            self.watcher.removePaths(paths)
+
+
+class AttachmentIndexer(QThread):
+
+    """Indexes the text of attachments in the background"""
+
+    def __init__(self, qnotero, zotero):
+
+        """
+        Constructor
+
+        Arguments:
+        qnotero -- a Qnotero instance
+        zotero -- the LibZotero instance whose attachments are indexed
+        """
+
+        QThread.__init__(self, qnotero)
+        self.qnotero = qnotero
+        self.zotero = zotero
+        self.pending = False
+        self.finished.connect(self._finished)
+
+    def refresh(self):
+
+        """
+        Starts indexing attachments, if this is enabled. If indexing is
+        already running, it is started again once it has finished.
+        """
+
+        if self.zotero.ftcache is None:
+            return
+        if self.isRunning():
+            self.pending = True
+            return
+        # Attachments are only indexed when there is nothing else to do
+        self.start(QThread.LowestPriority)
+
+    def stop(self):
+
+        """Interrupts indexing, and waits until it has stopped"""
+
+        self.pending = False
+        self.requestInterruption()
+        self.wait()
+
+    def run(self):
+
+        """Indexes the attachments"""
+
+        try:
+            self.zotero.update_ftcache(
+                should_stop=self.isInterruptionRequested)
+        except Exception as e:
+            print(u"indexer.run(): failed to index attachments: %s" % e)
+
+    def _finished(self):
+
+        """Starts the indexing that was requested while indexing"""
+
+        if self.pending:
+            self.pending = False
+            self.refresh()
+
+
+class NoteResolver(QThread):
+
+    """
+    Looks up the notes of results in the background. Before the notes are
+    looked up, the noteProvider is refreshed. If the notes have changed,
+    notesChanged is emitted, so that the notes that were looked up before
+    are looked up again.
+    """
+
+    resolved = pyqtSignal(object)
+    notesChanged = pyqtSignal()
+
+    def __init__(self, qnotero):
+
+        """
+        Constructor
+
+        Arguments:
+        qnotero -- a Qnotero instance
+        """
+
+        QThread.__init__(self, qnotero)
+        self.qnotero = qnotero
+        self.lock = threading.Lock()
+        self.queue = deque()
+        self.queued = set()
+        self.pending = False
+        self.finished.connect(self._finished)
+
+    def resolve(self, zoteroItems):
+
+        """
+        Looks up the notes of items whose notes are not known yet, or out of
+        date. The items are looked up before the ones that were queued
+        earlier, so that the rows that are visible now come first.
+
+        Arguments:
+        zoteroItems -- a list of zoteroItems
+        """
+
+        with self.lock:
+            for zoteroItem in reversed(zoteroItems):
+                if zoteroItem.has_note() is not None or \
+                        id(zoteroItem) in self.queued:
+                    continue
+                self.queue.appendleft(zoteroItem)
+                self.queued.add(id(zoteroItem))
+        # The thread also checks whether the notes have changed. A thread that
+        # is running may already have found the queue empty, so it is started
+        # again once it has finished.
+        if self.isRunning():
+            self.pending = True
+            return
+        self.start(QThread.LowPriority)
+
+    def stop(self):
+
+        """Discards the queued items, and waits until the lookup has stopped"""
+
+        with self.lock:
+            self.queue.clear()
+            self.queued.clear()
+        self.pending = False
+        self.requestInterruption()
+        self.wait()
+
+    def run(self):
+
+        """Looks up the queued notes"""
+
+        noteProvider = self.qnotero.noteProvider
+        if noteProvider is not None:
+            generation = noteProvider.generation
+            try:
+                noteProvider.refresh()
+            except Exception as e:
+                print(u"indexer.run(): failed to refresh notes: %s" % e)
+            if noteProvider.generation != generation:
+                self.notesChanged.emit()
+        while not self.isInterruptionRequested():
+            with self.lock:
+                if not self.queue:
+                    return
+                zoteroItem = self.queue.popleft()
+                self.queued.discard(id(zoteroItem))
+            try:
+                zoteroItem.get_note()
+            except Exception as e:
+                print(u"indexer.run(): failed to look up note: %s" % e)
+                zoteroItem.note = zoteroItem.noteProvider.generation, None
+            self.resolved.emit(zoteroItem)
+
+    def _finished(self):
+
+        """Looks up the notes that were queued while finishing"""
+
+        if not self.pending:
+            return
+        self.pending = False
+        with self.lock:
+            if not self.queue:
+                return
+        self.start(QThread.LowPriority)
+
+
+class RemoteSearcher(QThread):
+
+    """
+    Searches through the daemon in the background, so that a daemon that is
+    busy doesn't hold up the GUI. Only the latest query is searched for, and
+    its results are emitted with found.
+    """
+
+    found = pyqtSignal(str, object)
+
+    def __init__(self, qnotero, zotero):
+
+        """
+        Constructor
+
+        Arguments:
+        qnotero -- a Qnotero instance
+        zotero -- the RemoteZotero instance to search
+        """
+
+        QThread.__init__(self, qnotero)
+        self.zotero = zotero
+        self.lock = threading.Lock()
+        self.query = None
+        self.pending = False
+        self.finished.connect(self._finished)
+
+    def search(self, query):
+
+        """
+        Searches for a query, in place of the query that is waiting to be
+        searched for, if any
+
+        Arguments:
+        query -- a search query
+        """
+
+        with self.lock:
+            self.query = query
+        if self.isRunning():
+            self.pending = True
+            return
+        self.start()
+
+    def stop(self):
+
+        """Discards the waiting query, and waits until the search is done"""
+
+        with self.lock:
+            self.query = None
+        self.pending = False
+        self.wait()
+
+    def run(self):
+
+        """Searches for the waiting queries"""
+
+        while True:
+            with self.lock:
+                query = self.query
+                self.query = None
+            if query is None:
+                return
+            self.found.emit(query, self.zotero.search_results(query))
+
+    def _finished(self):
+
+        """Searches for the query that was entered while finishing"""
+
+        if not self.pending:
+            return
+        self.pending = False
+        with self.lock:
+            if self.query is None:
+                return
+        self.start()
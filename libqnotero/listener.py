@@ -16,44 +16,408 @@
 
 #
 
+import json
+import os
+import selectors
 import socket
-from libqnotero.config import getConfig
+import time
+from libqnotero.config import getConfig, configFolder
 from threading import Thread
 
+# Requests and responses are single lines, and longer requests are refused
+maxRequestSize = 65536
+# Connections that don't read their responses are closed once this many
+# bytes are waiting to be sent
+maxResponseSize = 16777216
+
+
+# The servers that can listen: the Qnotero GUI, and the indexing daemon.
+# Where Unix domain sockets are not available, they listen on listenerPort
+# plus an offset.
+servers = {u"qnotero": 0, u"daemon": 1}
+
+
+def socketPath(server=u"qnotero"):
+
+	"""
+	Keyword arguments:
+	server -- the name of the server (default=u"qnotero")
+
+	Returns:
+	The path of the Unix domain socket on which a server listens
+	"""
+
+	if server == u"qnotero" and getConfig(u"listenerSocket"):
+		return getConfig(u"listenerSocket")
+	folder = os.environ.get(u"XDG_RUNTIME_DIR") or configFolder()
+	if server == u"qnotero":
+		return os.path.join(folder, u"qnotero.sock")
+	return os.path.join(folder, u"qnotero-%s.sock" % server)
+
+
+def useUnixSocket():
+
+	"""
+	Returns:
+	True if Qnotero listens on a Unix domain socket, False if it listens on
+	a localhost port
+	"""
+
+	return hasattr(socket, u"AF_UNIX") and os.name == u"posix"
+
+
+def connect(timeout=5., server=u"qnotero"):
+
+	"""
+	Connects to a running Qnotero
+
+	Keyword arguments:
+	timeout -- the timeout in seconds (default=5.)
+	server -- the name of the server (default=u"qnotero")
+
+	Returns:
+	A connected socket
+
+	Raises:
+	OSError if Qnotero is not running
+	"""
+
+	if useUnixSocket():
+		sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		address = socketPath(server)
+	else:
+		sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		address = u"localhost", getConfig(u"listenerPort") + servers[server]
+	sock.settimeout(timeout)
+	try:
+		sock.connect(address)
+	except OSError:
+		sock.close()
+		raise
+	return sock
+
+
+def send(command, timeout=5., server=u"qnotero", **args):
+
+	"""
+	Sends a command to a running Qnotero, and waits for the response
+
+	Arguments:
+	command -- a command, such as "activate" or "search"
+
+	Keyword arguments:
+	timeout -- the timeout in seconds (default=5.)
+	server -- the name of the server (default=u"qnotero")
+	args -- the arguments of the command, such as query
+
+	Returns:
+	The response, as a dict
+
+	Raises:
+	OSError if Qnotero is not running
+	"""
+
+	request = dict(args, command=command)
+	with connect(timeout, server) as sock:
+		sock.sendall(json.dumps(request).encode(u"utf-8") + b"\n")
+		with sock.makefile(u"rb") as fd:
+			line = fd.readline()
+	if not line:
+		raise ConnectionError(u"no response from Qnotero")
+	return json.loads(line.decode(u"utf-8"))
+
 
 class Listener(Thread):
 
-	"""Listens for commands"""
+	"""
+	Listens for commands from other programs, on a Unix domain socket, or a
+	localhost port where those are not available. The thread sleeps until a
+	connection or a request arrives, and never waits for a client, so
+	responses are sent as the client reads them.
+
+	Every request is a line, with either a command and an argument, such as
+	"search doe 2001", or a JSON object, such as {"command": "search",
+	"query": "doe 2001", "limit": 10}. Every response is a JSON object on a
+	single line, in which ok indicates whether the command succeeded.
+	"""
+
+	# The maximum time in seconds that the listener sleeps before idle() is
+	# called, or None to only wake up for requests
+	timeout = None
+
+	def __init__(self, qnotero=None, server=u"qnotero"):
 
-	def __init__(self, qnotero=None):
-	
 		"""
 		Constructor
-		
-		Arguments:
-		qnotero -- a Qnotero instance
+
+		Keyword arguments:
+		qnotero -- a Qnotero instance (default=None)
+		server -- the name of the server (default=u"qnotero")
+
+		Raises:
+		OSError if another Qnotero is already listening
 		"""
-	
-		self.port = getConfig("listenerPort")
+
+		self.server = server
+		self.port = getConfig("listenerPort") + servers[server]
 		self.qnotero = qnotero
 		self.alive = True
 		Thread.__init__(self)
-		self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-		self.sock.bind((u"localhost", self.port))
-		self.sock.settimeout(1.)
+		self.daemon = True
+		self.commands = {
+			u"activate": self.activate,
+			u"ping": self.ping,
+			u"search": self.search,
+			}
+		self.sock = self.bind()
+		self.sock.setblocking(False)
+		self.selector = selectors.DefaultSelector()
+		self.selector.register(self.sock, selectors.EVENT_READ)
+		# Writing to the wake-up socket interrupts the selector when the
+		# listener is stopped
+		self.wakeup, self.wakeupWriter = socket.socketpair()
+		self.wakeup.setblocking(False)
+		self.selector.register(self.wakeup, selectors.EVENT_READ)
+		# The received data that doesn't make a complete request yet, and the
+		# responses that have not been sent yet, by connection
+		self.buffers = {}
+		self.outputs = {}
+
+	def bind(self):
+
+		"""
+		Returns:
+		A listening socket
+
+		Raises:
+		OSError if another Qnotero is already listening
+		"""
+
+		if not useUnixSocket():
+			sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+			sock.bind((u"localhost", self.port))
+			sock.listen()
+			return sock
+		path = socketPath(self.server)
+		if os.path.exists(path):
+			# A socket that is left behind by a Qnotero that crashed doesn't
+			# accept connections
+			try:
+				connect(1., self.server).close()
+			except OSError:
+				os.remove(path)
+			else:
+				raise OSError(u"Qnotero is already listening on %s" % path)
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		# Only the user can connect, from the moment that the socket exists
+		umask = os.umask(0o177)
+		try:
+			sock.bind(path)
+		finally:
+			os.umask(umask)
+		sock.listen()
+		self.path = path
+		return sock
+
+	def stop(self):
+
+		"""Stops listening"""
+
+		self.alive = False
+		try:
+			self.wakeupWriter.send(b"\0")
+		except OSError:
+			pass
 
 	def run(self):
 
-		"""Listen for activation signals and pops up the Qnotero window"""
-		
+		"""Serves requests until the listener is stopped"""
+
+		print(u"listener.run(): listening on %s" % self.sock.getsockname())
 		while self.alive:
+			for key, events in self.selector.select(self.timeout):
+				if key.fileobj is self.wakeup:
+					continue
+				if key.fileobj is self.sock:
+					self.accept()
+					continue
+				if events & selectors.EVENT_WRITE:
+					self.write(key.fileobj)
+				if events & selectors.EVENT_READ and \
+					key.fileobj in self.buffers:
+					self.read(key.fileobj)
+			self.idle()
+		for conn in list(self.buffers):
+			self.close(conn)
+		self.selector.close()
+		self.sock.close()
+		if getattr(self, u"path", None) is not None:
 			try:
-				s, comm_addr = self.sock.recvfrom(128)
-			except:
-				s = None
-			if s is not None:
-				print("listener.run(): received '%s'" % s)
-				if b"activate" == s[:8]:
-					print("listener.run(): activating")
-					self.qnotero.sysTray.listenerActivated.emit()
+				os.remove(self.path)
+			except OSError:
+				pass
+
+	def idle(self):
+
+		"""Is called after requests have been handled, or on a timeout"""
+
+		pass
+
+	def accept(self):
+
+		"""Accepts a connection"""
+
+		try:
+			conn, address = self.sock.accept()
+		except OSError:
+			return
+		conn.setblocking(False)
+		self.selector.register(conn, selectors.EVENT_READ)
+		self.buffers[conn] = b""
+		self.outputs[conn] = b""
+
+	def close(self, conn):
+
+		"""
+		Closes a connection
+
+		Arguments:
+		conn -- a connected socket
+		"""
+
+		self.selector.unregister(conn)
+		del self.buffers[conn]
+		del self.outputs[conn]
+		conn.close()
+
+	def read(self, conn):
+
+		"""
+		Reads from a connection, and answers the requests that are complete
+
+		Arguments:
+		conn -- a connected socket
+		"""
+
+		try:
+			data = conn.recv(4096)
+		except BlockingIOError:
+			return
+		except OSError:
+			data = b""
+		if not data:
+			self.close(conn)
+			return
+		buffer = self.buffers[conn] + data
+		while b"\n" in buffer:
+			line, buffer = buffer.split(b"\n", 1)
+			response = self.handle(line)
+			self.outputs[conn] += json.dumps(response).encode(u"utf-8") + \
+				b"\n"
+		if len(buffer) > maxRequestSize or \
+			len(self.outputs[conn]) > maxResponseSize:
+			self.close(conn)
+			return
+		self.buffers[conn] = buffer
+		if self.outputs[conn]:
+			self.write(conn)
+
+	def write(self, conn):
+
+		"""
+		Sends as much of the responses as the connection accepts without
+		waiting, and waits for the connection to accept more if needed
+
+		Arguments:
+		conn -- a connected socket
+		"""
+
+		try:
+			sent = conn.send(self.outputs[conn])
+		except BlockingIOError:
+			sent = 0
+		except OSError:
+			self.close(conn)
+			return
+		self.outputs[conn] = self.outputs[conn][sent:]
+		events = selectors.EVENT_READ
+		if self.outputs[conn]:
+			events |= selectors.EVENT_WRITE
+		if self.selector.get_key(conn).events != events:
+			self.selector.modify(conn, events)
+
+	def handle(self, line):
+
+		"""
+		Answers a request
+
+		Arguments:
+		line -- a request, without the newline
+
+		Returns:
+		A response, as a dict
+		"""
+
+		try:
+			line = line.decode(u"utf-8").strip()
+			if line.startswith(u"{"):
+				request = json.loads(line)
+			else:
+				command, _, argument = line.partition(u" ")
+				request = {u"command": command, u"query": argument}
+			command = self.commands.get(request.get(u"command"))
+			if command is None:
+				return {u"ok": False, u"error": u"unknown command '%s'"
+					% request.get(u"command")}
+			print(u"listener.handle(): received '%s'" % line)
+			return command(request)
+		except Exception as e:
+			print(u"listener.handle(): failed to handle '%s': %s" % (line, e))
+			return {u"ok": False, u"error": str(e)}
+
+	def zotero(self):
+
+		"""
+		Returns:
+		The LibZotero instance that searches are answered from
+		"""
+
+		return self.qnotero.zotero
+
+	def activate(self, request):
+
+		"""Pops up the Qnotero window"""
+
+		print("listener.activate(): activating")
+		self.qnotero.sysTray.listenerActivated.emit()
+		return {u"ok": True}
+
+	def ping(self, request):
+
+		"""Checks whether Qnotero is running"""
+
+		return {u"ok": True}
+
+	def search(self, request):
+
+		"""
+		Searches the index that has already been built. The request can
+		limit the number of results. The response counts all matches, also
+		those that are not among the results.
+		"""
 
+		t = time.time()
+		query = request.get(u"query", u"")
+		limit = request.get(u"limit")
+		if limit is not None:
+			limit = int(limit)
+		# Only the requested number of results is ranked, or all of them
+		results = self.zotero().search_results(query, max_results=limit or 0)
+		if limit is None:
+			zoteroItems = list(results)
+		else:
+			zoteroItems = results.fetch(limit)
+		return {u"ok": True, u"query": query, u"count": results.matches,
+			u"results": [zoteroItem.as_dict() for zoteroItem in zoteroItems],
+			u"time": time.time() - t}
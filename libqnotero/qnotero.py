@@ -26,7 +26,8 @@ from libqnotero.qt.QtCore import QSettings, QCoreApplication, QObject, QEvent
 from libqnotero.sysTray import SysTray
 from libqnotero.config import saveConfig, restoreConfig, getConfig
 from libqnotero.qnoteroItemDelegate import QnoteroItemDelegate
-from libqnotero.qnoteroItem import QnoteroItem
+from libqnotero.indexer import Indexer, AttachmentIndexer, NoteResolver, \
+    DatabaseWatcher, RemoteSearcher
 from libqnotero.uiloader import UiLoader
 from libzotero.libzotero import LibZotero
 
@@ -90,7 +91,10 @@ class Qnotero(QMainWindow, UiLoader):
         else:
             e.accept()
             if self.listener is not None:
-                self.listener.alive = False
+                self.listener.stop()
+            self.indexer.wait()
+            self.attachmentIndexer.stop()
+            self.noteResolver.stop()
             print(u'qnotero.closeEvent(): Exiting Qnotero, bye...')
             sys.exit()
 
@@ -100,12 +104,69 @@ class Qnotero(QMainWindow, UiLoader):
 
         self.ui.labelNoteAvailable.hide()
 
+    def noteResolved(self, zoteroItem):
+
+        """
+		Updates the note hint once the note of the hovered item is known
+
+		Arguments:
+		zoteroItem -- the zoteroItem whose note was looked up
+		"""
+
+        if zoteroItem is self.hoveredItem:
+            self.updateNoteHint(zoteroItem)
+
+    def notesChanged(self):
+
+        """
+		Looks up the notes of the visible results again, once the notes have
+		changed
+		"""
+
+        self.ui.listWidgetResults.viewport().update()
+        self.resolveNotes()
+
     def openNote(self):
 
         """Open the active note"""
 
         self.activeNote.open()
 
+    def indexed(self, success):
+
+        """
+		Shows the results from the new index once indexing has finished
+
+		Arguments:
+		success -- indicates whether the index was updated
+		"""
+
+        if hasattr(self, u"sysTray"):
+            self.sysTray.setToolTip(u"Qnotero")
+        if not success:
+            self.showResultMsg(u"Failed to index the Zotero library")
+        elif self.ui.lineEditQuery.text() != u"":
+            self.search()
+        else:
+            self.noResults()
+        if success:
+            self.attachmentIndexer.refresh()
+
+    def indexProgress(self, percentage):
+
+        """
+		Shows the progress of indexing
+
+		Arguments:
+		percentage -- the progress as a percentage
+		"""
+
+        msg = u"Indexing Zotero library (%d%%)" % percentage
+        if hasattr(self, u"sysTray"):
+            self.sysTray.setToolTip(msg)
+        if self.ui.listWidgetResults.count() == 0:
+            self.showResultMsg(msg)
+
     def noResults(self, query=None):
 
         """
@@ -198,9 +259,15 @@ class Qnotero(QMainWindow, UiLoader):
 
         """Re-inits the parts of the GUI that can be changed at runtime."""
 
+        if hasattr(self, u"noteResolver"):
+            self.noteResolver.stop()
+        self.noteResolver = NoteResolver(self)
+        self.noteResolver.resolved.connect(self.noteResolved)
+        self.noteResolver.notesChanged.connect(self.notesChanged)
+        self.hoveredItem = None
         self.setTheme()
         self.setupUi()
-        self.noteProvider = []
+        self.noteProvider = None
         self.noResults()
         self.ui.listWidgetResults.clear()
         self.ui.textAbstract.setText(u'')
@@ -210,11 +277,62 @@ class Qnotero(QMainWindow, UiLoader):
             from libzotero._noteProvider.gnoteProvider import GnoteProvider
             print(u"qnotero.reInit(): using GnoteProvider")
             self.noteProvider = GnoteProvider(self)
-        self.zotero = LibZotero(getConfig(u"zoteroPath"), self.noteProvider)
+        elif getConfig(u'noteProvider') == u'markdown':
+            from libzotero._noteProvider.mdNoteProvider import MdNoteProvider
+            print(u"qnotero.reInit(): using MdNoteProvider")
+            self.noteProvider = MdNoteProvider(self,
+                                               getConfig(u'mdNoteproviderPath'))
+        if hasattr(self, u"indexer"):
+            # The thread of the previous index cannot be destroyed while it is
+            # running
+            self.indexer.wait()
+            self.attachmentIndexer.stop()
+            if self.databaseWatcher is not None:
+                self.databaseWatcher.stop()
+            if self.remoteSearcher is not None:
+                self.remoteSearcher.stop()
+        self.zotero = None
+        self.remoteSearcher = None
+        if getConfig(u"useDaemon"):
+            # The index is shared with other front-ends through the daemon,
+            # if it is running. The daemon is searched in the background.
+            from libqnotero.remoteZotero import RemoteZotero
+            try:
+                self.zotero = RemoteZotero(self.noteProvider)
+            except (OSError, ValueError) as e:
+                print(u"qnotero.reInit(): daemon not available: %s" % e)
+            else:
+                self.remoteSearcher = RemoteSearcher(self, self.zotero)
+                self.remoteSearcher.found.connect(self.showResults)
+        if self.zotero is None:
+            self.zotero = LibZotero(getConfig(u"zoteroPath"),
+                                    self.noteProvider, autoUpdate=False)
+        self.indexer = Indexer(self, self.zotero)
+        self.indexer.progress.connect(self.indexProgress)
+        self.indexer.indexed.connect(self.indexed)
+        self.attachmentIndexer = AttachmentIndexer(self, self.zotero)
+        # Indexing attachments gives way to updating the index
+        self.indexer.started.connect(self.attachmentIndexer.requestInterruption)
+        # Changes to the database are picked up as they happen, instead of
+        # checking the database at every search
+        self.databaseWatcher = None
+        if getConfig(u"watchDatabase"):
+            self.databaseWatcher = DatabaseWatcher(self, self.zotero,
+                                                   self.indexer)
+        self.indexer.refresh()
+        self.attachmentIndexer.refresh()
         if hasattr(self, u"sysTray"):
             self.sysTray.setIcon(self.theme.icon("qnotero", ".png"))
 
-    def restoreState(self):
+    def resolveNotes(self):
+
+        """Looks up the notes of the visible results in the background"""
+
+        self.noteResolver.resolve(
+            self.ui.listWidgetResults.visibleZoteroItems())
+
+    @staticmethod
+    def restoreState():
 
         """Restore the settings"""
 
@@ -251,16 +369,40 @@ class Qnotero(QMainWindow, UiLoader):
         if len(query) < getConfig(u"minQueryLength"):
             self.noResults()
             return
-        zoteroItemList = self.zotero.search(query)
-        if len(zoteroItemList) == 0:
+        self.searchFocus = setFocus
+        if self.remoteSearcher is not None:
+            self.remoteSearcher.search(query)
+            return
+        # Searches use the current index while the indexer updates it
+        if self.databaseWatcher is None:
+            self.indexer.refresh()
+        self.showResults(query, self.zotero.search_results(query))
+
+    def showResults(self, query, results):
+
+        """
+		Shows the results of a search, unless the query has been changed
+		since
+
+		Arguments:
+		query		--	A search query.
+		results 	--	A searchResults object.
+		"""
+
+        if query != self.ui.lineEditQuery.text():
+            return
+        if len(results) == 0:
             self.noResults(query)
             return
-        self.showResultMsg(u"%d results for %s" % (len(zoteroItemList), query))
-        for zoteroItem in zoteroItemList:
-            qnoteroItem = QnoteroItem(self, zoteroItem,
-                                      self.ui.listWidgetResults)
-            self.ui.listWidgetResults.addItem(qnoteroItem)
-        if setFocus:
+        if results.truncated():
+            self.showResultMsg(u"%d of %d results for %s"
+                               % (len(results), results.matches, query))
+        else:
+            self.showResultMsg(u"%d results for %s" % (len(results), query))
+        # Only the first page of results is shown until the list is scrolled
+        self.ui.listWidgetResults.setResults(results)
+        self.resolveNotes()
+        if self.searchFocus:
             self.ui.listWidgetResults.setFocus()
 
     def setSize(self, size):
@@ -313,6 +455,21 @@ class Qnotero(QMainWindow, UiLoader):
 
         self.ui.labelNoteAvailable.show()
 
+    def updateNoteHint(self, zoteroItem):
+
+        """
+		Shows or hides the note hint, depending on whether an item has a
+		note that has been looked up
+
+		Arguments:
+		zoteroItem -- a zoteroItem
+		"""
+
+        if zoteroItem.has_note():
+            self.showNoteHint()
+        else:
+            self.hideNoteHint()
+
     def showResultMsg(self, msg):
 
         """
@@ -334,29 +491,29 @@ class Qnotero(QMainWindow, UiLoader):
             actCopyAbs = contextMenu.addAction(u"Copy abstract")
             actCopyRef = contextMenu.addAction(u"Copy Reference")
             action = contextMenu.exec_(self.mapToGlobal(e.pos()))
-            item = source.itemAt(e.pos())
-            if (action is None) or (item is None):
+            zoteroItem = source.zoteroItemAt(e.pos())
+            if (action is None) or (zoteroItem is None):
                 return True
             clipboard = QtGui.QApplication.clipboard()
             clipboard.clear(mode=clipboard.Clipboard)
             if action is actCopyAuthordate:
-                clipboard.setText(item.zoteroItem.author_date_format(), mode=clipboard.Clipboard)
+                clipboard.setText(zoteroItem.author_date_format(), mode=clipboard.Clipboard)
                 return True
             elif action is actCopyDOI:
-                if item.zoteroItem.doi is not None:
-                    clipboard.setText(item.zoteroItem.doi, mode=clipboard.Clipboard)
+                if zoteroItem.doi is not None:
+                    clipboard.setText(zoteroItem.doi, mode=clipboard.Clipboard)
                 return True
             elif action is actCopyTitle:
-                title = item.zoteroItem.format_title()
+                title = zoteroItem.format_title()
                 if title is not None:
                     clipboard.setText(title, mode=clipboard.Clipboard)
                 return True
             elif action is actCopyAbs:
-                if item.zoteroItem.abstract is not None:
-                    clipboard.setText(item.zoteroItem.abstract, mode=clipboard.Clipboard)
+                if zoteroItem.abstract is not None:
+                    clipboard.setText(zoteroItem.abstract, mode=clipboard.Clipboard)
                 return True
             elif action is actCopyRef:
-                clipboard.setText(item.zoteroItem.full_format(), mode=clipboard.Clipboard)
+                clipboard.setText(zoteroItem.full_format(), mode=clipboard.Clipboard)
                 return True
         return QMainWindow.eventFilter(self, source, e)
 
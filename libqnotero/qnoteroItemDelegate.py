@@ -18,16 +18,20 @@
 
 #
 
+from collections import OrderedDict
 from libqnotero.qt.QtGui import QStyledItemDelegate, QStyle, QTextDocument
 from libqnotero.qt.QtGui import QFont, QFontMetrics, QAbstractTextDocumentLayout
 from libqnotero.qt.QtCore import Qt, QRect, QSize
-from libzotero.zotero_item import cache as zoteroCache
+from libqnotero.qnoteroResultModel import QnoteroResultModel
 
 
 class QnoteroItemDelegate(QStyledItemDelegate):
 
 	"""Draws pretty result items"""
 
+	# The number of laid-out documents that are kept for repainting
+	maxDocuments = 256
+
 	def __init__(self, qnotero):
 
 		"""
@@ -59,6 +63,70 @@ class QnoteroItemDelegate(QStyledItemDelegate):
 		self.notePixmap = self.qnotero.theme.pixmap(u"note")
 		self.pixmapSize = self.pdfPixmap.height()+0.5*self.dy
 		self.roundness = self.qnotero.theme.roundness()
+		# The delegate is recreated when the theme changes, so only a
+		# change in width invalidates the documents
+		self.documents = OrderedDict()
+		self.documentWidth = None
+		self.hits = 0
+		self.misses = 0
+
+	def invalidate(self):
+
+		"""Discards the laid-out documents"""
+
+		if self.qnotero.debug:
+			print(u"qnoteroItemDelegate.invalidate(): %s" % self.cacheStats())
+		self.documents.clear()
+
+	def cacheStats(self):
+
+		"""
+		Returns:
+		A description of the document cache, for debugging
+		"""
+
+		lookups = max(1, self.hits + self.misses)
+		return u"%d documents, %d hits, %d misses (%.0f%% hit rate)" % (
+			len(self.documents), self.hits, self.misses,
+			100. * self.hits / lookups)
+
+	def document(self, zoteroItem, width):
+
+		"""
+		Retrieves the laid-out text of an item, creating it if it is not
+		cached
+
+		Arguments:
+		zoteroItem -- a zoteroItem
+		width -- the width of the row
+
+		Returns:
+		A QTextDocument
+		"""
+
+		if width != self.documentWidth:
+			if self.documentWidth is not None:
+				self.invalidate()
+			self.documentWidth = width
+		# Documents are looked up by their text, so that they are never
+		# out of date, even if the index has been updated
+		itemText = zoteroItem.full_formatHTML()
+		textRenderer = self.documents.get(itemText)
+		if textRenderer is not None:
+			self.hits += 1
+			self.documents.move_to_end(itemText)
+		else:
+			self.misses += 1
+			textRenderer = QTextDocument()
+			textRenderer.setHtml(itemText)
+			# Lay out the document now, rather than while painting
+			textRenderer.size()
+			self.documents[itemText] = textRenderer
+			while len(self.documents) > self.maxDocuments:
+				self.documents.popitem(last=False)
+		if self.qnotero.debug and (self.hits + self.misses) % 500 == 0:
+			print(u"qnoteroItemDelegate.document(): %s" % self.cacheStats())
+		return textRenderer
 
 	def sizeHint(self, option, index):
 
@@ -87,10 +155,9 @@ class QnoteroItemDelegate(QStyledItemDelegate):
 		"""
 
 		# Retrieve the data
-		model = index.model()
-		record = model.data(index)
-		text = record
-		zoteroItem = zoteroCache[text]
+		zoteroItem = index.data(QnoteroResultModel.ZoteroItemRole)
+		if zoteroItem is None:
+			return
 
 		if zoteroItem.fulltext is None:
 			pixmap = self.noPdfPixmap
@@ -102,11 +169,12 @@ class QnoteroItemDelegate(QStyledItemDelegate):
 		if option.state & QStyle.State_MouseOver:
 			background = self.palette.Highlight
 			foreground = self.palette.HighlightedText
-			_note = zoteroItem.get_note()
-			if _note is not None:
-				self.qnotero.showNoteHint()
-			else:
-				self.qnotero.hideNoteHint()
+			# Notes are looked up in the background, and the hint is updated
+			# once the note of the hovered item is known
+			self.qnotero.hoveredItem = zoteroItem
+			if zoteroItem.has_note() is None:
+				self.qnotero.noteResolver.resolve([zoteroItem])
+			self.qnotero.updateNoteHint(zoteroItem)
 
 		elif option.state & QStyle.State_Selected:
 			background = self.palette.Dark
@@ -143,10 +211,8 @@ class QnoteroItemDelegate(QStyledItemDelegate):
 
 		f = [self.tagFont, self.italicFont, self.regularFont,
 			 self.boldFont]
-		itemText = zoteroItem.full_formatHTML()
-		textRenderer = QTextDocument()
+		textRenderer = self.document(zoteroItem, option.rect.width())
 		context = QAbstractTextDocumentLayout.PaintContext()
-		textRenderer.setHtml(itemText)
 		painter.translate(_rect.topLeft())
 		textRenderer.documentLayout().draw(painter, context)
 		_rect = _rect.adjusted(0, self.dy, 0, 0)
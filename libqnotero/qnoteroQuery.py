@@ -57,8 +57,8 @@ class QnoteroQuery(QLineEdit):
 				self.qnotero.search(setFocus=True)
 			elif self.qnotero.ui.listWidgetResults.count() > 0:
 				self.qnotero.ui.listWidgetResults.setFocus()
-			self.qnotero.ui.listWidgetResults.setCurrentItem(
-				self.qnotero.ui.listWidgetResults.item(0))
+			self.qnotero.ui.listWidgetResults.setCurrentIndex(
+				self.qnotero.ui.listWidgetResults.model().index(0))
 			return
 
 		QLineEdit.keyPressEvent(self, e)
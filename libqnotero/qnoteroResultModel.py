@@ -0,0 +1,168 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+
+from libqnotero.qt.QtCore import Qt, QAbstractListModel, QModelIndex, \
+	QMimeData
+from libqnotero.config import getConfig
+
+
+class QnoteroResultModel(QAbstractListModel):
+
+	"""
+	The Qnotero results, backed directly by the ids of the matching items.
+	Rows are added a page at a time as the view is scrolled, and the
+	zoteroItems are only looked up when a row is drawn.
+	"""
+
+	# The zoteroItem of a row
+	ZoteroItemRole = Qt.UserRole + 1
+
+	def __init__(self, parent=None):
+
+		"""
+		Constructor
+
+		Keyword arguments:
+		parent -- a parent QObject (default=None)
+		"""
+
+		QAbstractListModel.__init__(self, parent)
+		self.results = None
+		self.rows = 0
+
+	def setResults(self, results):
+
+		"""
+		Replaces the results, and adds the first page of rows
+
+		Arguments:
+		results -- a searchResults object, or None to clear the results
+		"""
+
+		self.beginResetModel()
+		self.results = results
+		self.rows = 0
+		self.endResetModel()
+		self.fetchMore(QModelIndex())
+
+	def rowCount(self, parent=QModelIndex()):
+
+		"""
+		Returns:
+		The number of rows that have been fetched
+		"""
+
+		if parent.isValid():
+			return 0
+		return self.rows
+
+	def canFetchMore(self, parent=QModelIndex()):
+
+		"""
+		Returns:
+		True if there are results that have not been added yet
+		"""
+
+		if parent.isValid() or self.results is None:
+			return False
+		return self.rows < len(self.results)
+
+	def fetchMore(self, parent=QModelIndex()):
+
+		"""Adds the next page of rows"""
+
+		if not self.canFetchMore(parent):
+			return
+		count = min(getConfig(u"resultPageSize"),
+			len(self.results) - self.rows)
+		self.beginInsertRows(QModelIndex(), self.rows, self.rows + count - 1)
+		self.rows += count
+		self.endInsertRows()
+
+	def zoteroItem(self, index):
+
+		"""
+		Arguments:
+		index -- a QModelIndex
+
+		Returns:
+		The zoteroItem of a row, or None if the index is not valid
+		"""
+
+		if not index.isValid() or index.row() >= self.rows:
+			return None
+		return self.results[index.row()]
+
+	def data(self, index, role=Qt.DisplayRole):
+
+		"""
+		Arguments:
+		index -- a QModelIndex
+
+		Keyword arguments:
+		role -- a data role (default=Qt.DisplayRole)
+
+		Returns:
+		The data of a row
+		"""
+
+		zoteroItem = self.zoteroItem(index)
+		if zoteroItem is None:
+			return None
+		if role == self.ZoteroItemRole:
+			return zoteroItem
+		if role in (Qt.DisplayRole, Qt.ToolTipRole):
+			return zoteroItem.simple_format()
+		return None
+
+	def flags(self, index):
+
+		"""
+		Arguments:
+		index -- a QModelIndex
+
+		Returns:
+		The item flags of a row
+		"""
+
+		if not index.isValid():
+			return Qt.NoItemFlags
+		return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsDragEnabled
+
+	def mimeTypes(self):
+
+		return [u"text/plain"]
+
+	def mimeData(self, indexes):
+
+		"""
+		Dragged results are copied as references
+
+		Arguments:
+		indexes -- a list of QModelIndexes
+
+		Returns:
+		A QMimeData
+		"""
+
+		mimeData = QMimeData()
+		mimeData.setText(u"\n\n".join(self.zoteroItem(index).full_format()
+			for index in indexes if self.zoteroItem(index) is not None))
+		return mimeData
@@ -16,14 +16,15 @@
 
 #
 
-from libqnotero.qt.QtGui import QListWidget, QInputDialog
+from libqnotero.qt.QtGui import QListView, QInputDialog
 from libqnotero.qt.QtCore import Qt
+from libqnotero.qnoteroResultModel import QnoteroResultModel
 import subprocess
 import os
 import platform
 
 
-class QnoteroResults(QListWidget):
+class QnoteroResults(QListView):
     """The Qnotero result list"""
 
     def __init__(self, qnotero):
@@ -35,24 +36,100 @@ class QnoteroResults(QListWidget):
 		qnotero -- a Qnotero instance
 		"""
 
-        QListWidget.__init__(self, qnotero)
-        self.itemDoubleClicked.connect(self.DoubleClicked)
-        self.itemClicked.connect(self.Clicked)
+        QListView.__init__(self, qnotero)
+        self.setModel(QnoteroResultModel(self))
+        # All rows have the same height, so the view doesn't need to measure
+        # them
+        self.setUniformItemSizes(True)
+        self.doubleClicked.connect(self.DoubleClicked)
+        self.clicked.connect(self.Clicked)
         self.setMouseTracking(True)
+        self.verticalScrollBar().valueChanged.connect(self.scrolled)
 
+    def clear(self):
 
-    def DoubleClicked(self, item):
+        """Removes all results"""
+
+        self.model().setResults(None)
+
+    def count(self):
+
+        """
+		Returns:
+		The number of results that have been added to the list
+		"""
+
+        return self.model().rowCount()
+
+    def setResults(self, results):
+
+        """
+		Shows the results of a search. Only the first page of results is
+		added, and the others are added as the list is scrolled.
+
+		Arguments:
+		results -- a searchResults object
+		"""
+
+        self.model().setResults(results)
+
+    def scrolled(self, value):
+
+        """
+		Looks up the notes of the results that have scrolled into view
+
+		Arguments:
+		value -- the position of the scrollbar
+		"""
+
+        self.qnotero.resolveNotes()
+
+    def visibleZoteroItems(self):
+
+        """
+		Returns:
+		A list of the zoteroItems in the visible rows, or in all rows that
+		have been added if the list has not been laid out yet
+		"""
+
+        model = self.model()
+        rect = self.viewport().rect()
+        first = self.indexAt(rect.topLeft())
+        if not first.isValid():
+            return [model.zoteroItem(model.index(row))
+                    for row in range(model.rowCount())]
+        last = self.indexAt(rect.bottomLeft())
+        if last.isValid():
+            end = last.row() + 1
+        else:
+            end = model.rowCount()
+        return [model.zoteroItem(model.index(row))
+                for row in range(first.row(), end)]
+
+    def zoteroItemAt(self, pos):
+
+        """
+		Arguments:
+		pos -- a QPoint in viewport coordinates
+
+		Returns:
+		The zoteroItem at a position, or None if there is none
+		"""
+
+        return self.model().zoteroItem(self.indexAt(pos))
+
+    def DoubleClicked(self, index):
 
         """
 		Open file attachment or URL
 
 		Arguments:
-		item -- a qnoteroItem
+		index -- a QModelIndex
 		"""
 
-        if item is None or not hasattr(item, "zoteroItem"):
+        zoteroItem = self.model().zoteroItem(index)
+        if zoteroItem is None:
             return
-        zoteroItem = item.zoteroItem
         if zoteroItem.fulltext is None and zoteroItem.url is None:
             print('qnoteroResults.mousePressEvent(): no file attachment nor url')
             return
@@ -103,44 +180,41 @@ class QnoteroResults(QListWidget):
 		e -- a QKeyEvent
 		"""
 
-        if (e.key() == Qt.Key_Up and self.currentRow() == 0) \
+        if (e.key() == Qt.Key_Up and self.currentIndex().row() == 0) \
                 or (e.key() == Qt.Key_F and Qt.ControlModifier & e.modifiers()):
             self.qnotero.ui.lineEditQuery.selectAll()
             self.qnotero.ui.lineEditQuery.setFocus()
             return
         # AD : pressing 'Enter' opens the item
         elif (e.key() == Qt.Key_Return):
-            item = self.currentItem()
-            self.DoubleClicked(item)
+            self.DoubleClicked(self.currentIndex())
             return
 
         # AD : pressing 'x' opens the item with xournalpp
         elif (e.key() == Qt.Key_X):
-            item = self.currentItem()
-            self.OpenXournalpp(item)
+            self.OpenXournalpp(self.currentIndex())
             return
 
         # AD : pressing 'm' starts writing an email with the pdf attached
         elif (e.key() == Qt.Key_M):
-            item = self.currentItem()
-            self.SendByMail(item)
+            self.SendByMail(self.currentIndex())
             return
 
-        QListWidget.keyPressEvent(self, e)
+        QListView.keyPressEvent(self, e)
 
 
-    def OpenXournalpp(self, item):
+    def OpenXournalpp(self, index):
         """
         Open file in xournalpp
 
         Arguments:
-        item -- a qnoteroItem
+        index -- a QModelIndex
         """
         #TODO : refactor with DoubleClicked()
 
-        if item is None or not hasattr(item, "zoteroItem"):
+        zoteroItem = self.model().zoteroItem(index)
+        if zoteroItem is None:
             return
-        zoteroItem = item.zoteroItem
         if zoteroItem.fulltext is None and zoteroItem.url is None:
             return
         # If there is no a fulltext item : return
@@ -177,18 +251,18 @@ class QnoteroResults(QListWidget):
             print("qnoteroResults.OpenXournalpp(): failed to open file, sorry... %s" % exc)
 
 
-    def SendByMail(self, item):
+    def SendByMail(self, index):
         """
         Start writing an email with the pdf attached
 
         Arguments:
-        item -- a qnoteroItem
+        index -- a QModelIndex
         """
         #TODO : refactor with DoubleClicked()
 
-        if item is None or not hasattr(item, "zoteroItem"):
+        zoteroItem = self.model().zoteroItem(index)
+        if zoteroItem is None:
             return
-        zoteroItem = item.zoteroItem
         if zoteroItem.fulltext is None and zoteroItem.url is None:
             return
         # If there is no a fulltext item : return
@@ -223,8 +297,8 @@ class QnoteroResults(QListWidget):
         except Exception as exc:
             print("qnoteroResults.OpenXournalpp(): failed to open file, sorry... %s" % exc)
 
-    def Clicked(self, item):
-        if item is None or not hasattr(item, "zoteroItem"):
+    def Clicked(self, index):
+        zoteroItem = self.model().zoteroItem(index)
+        if zoteroItem is None:
             return
-        zoteroItem = item.zoteroItem
         self.qnotero.ui.textAbstract.setText(zoteroItem.abstract)
@@ -0,0 +1,135 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+
+from libqnotero.config import getConfig
+from libqnotero.listener import send
+from libzotero.search_results import searchResults
+from libzotero.zotero_item import zoteroItem
+
+
+class RemoteIndex(object):
+
+	"""The items of a search result that was received from the daemon"""
+
+	def __init__(self, zoteroItems):
+
+		self.items = {item.id: item for item in zoteroItems}
+
+
+class RemoteZotero(object):
+
+	"""
+	Searches through the indexing daemon, in place of a LibZotero that
+	holds its own index. The daemon keeps the index up to date.
+	"""
+
+	def __init__(self, noteProvider=None):
+
+		"""
+		Constructor
+
+		Keyword arguments:
+		noteProvider -- a noteProvider object (default=None)
+
+		Raises:
+		OSError if the daemon is not running
+		"""
+
+		self.noteProvider = noteProvider
+		# Attachments are indexed by the daemon
+		self.ftcache = None
+		self.error = False
+		status = send(u"status", server=u"daemon")
+		print(u"remoteZotero.__init__(): using daemon %d with %d items"
+			% (status[u"pid"], status[u"items"]))
+
+	def database_files(self):
+
+		return []
+
+	def needs_update(self):
+
+		return False
+
+	def update(self, force=False, progress=None):
+
+		"""
+		Asks the daemon to update the index
+
+		Keyword arguments:
+		force -- indicates that the index should be rebuilt (default=False)
+		progress -- ignored (default=None)
+
+		Returns:
+		True if the daemon could be reached, False otherwise
+		"""
+
+		if not force:
+			return True
+		try:
+			send(u"update", server=u"daemon", force=True)
+		except (OSError, ValueError) as e:
+			print(u"remoteZotero.update(): %s" % e)
+			return False
+		return True
+
+	def update_ftcache(self, should_stop=None):
+
+		pass
+
+	def search(self, query):
+
+		return list(self.search_results(query))
+
+	def search_results(self, query, max_results=None):
+
+		"""
+		Arguments:
+		query -- a search query
+
+		Keyword arguments:
+		max_results -- the maximum number of results, 0 for no limit, or None
+			for the maxResults setting (default=None)
+
+		Returns:
+		A searchResults object
+		"""
+
+		if max_results is None:
+			max_results = getConfig(u"maxResults")
+		args = {u"query": query}
+		if max_results:
+			args[u"limit"] = max_results
+		try:
+			response = send(u"search", server=u"daemon", **args)
+		except (OSError, ValueError) as e:
+			print(u"remoteZotero.search_results(): %s" % e)
+			self.error = True
+			return searchResults(None, (), query)
+		if not response.get(u"ok"):
+			print(u"remoteZotero.search_results(): %s"
+				% response.get(u"error"))
+			return searchResults(None, (), query)
+		self.error = False
+		zoteroItems = [zoteroItem.from_dict(info, self.noteProvider)
+			for info in response[u"results"]]
+		return searchResults(RemoteIndex(zoteroItems),
+			[item.id for item in zoteroItems], query,
+			matches=response.get(u"count"))
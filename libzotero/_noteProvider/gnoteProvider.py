@@ -22,20 +22,45 @@ import os
 import os.path
 import re
 import subprocess
+import threading
+import time
 try:
 	import Levenshtein
 except:
 	print("libzotero._noteProvider.gnoteProvider: failed to import Levenshtein")
 
+# The bold headings with which notes about an item start, and the years in
+# them
+heading = re.compile(r"<bold>([^\n]*)")
+heading_year = re.compile(r"\((\d{4})\)")
+strip_p = re.compile('<.*?>')
+
+
 class GnoteProvider(object):
 
 	"""
 	libgnote provides an interface to Gnote and is a replacement
 	for the deprecated gnote.py module
+
+	The notes are parsed once, into an index that maps (first word of the
+	heading, year) keys onto the notes about an item. The index is refreshed
+	for notes that changed when the notes folder changes, or when it has not
+	been checked for refreshInterval seconds. The generation is increased
+	whenever the index changes, so that notes that were looked up before can
+	be looked up again.
 	"""
 
+	refreshInterval = 5
+
 	def __init__(self, qnotero):
 
+		self.index = {}
+		self.files = {}
+		self.folderMtime = None
+		self.lastRefresh = 0
+		self.generation = 0
+		self.lock = threading.Lock()
+
 		if os.name != "posix":
 			self.path = None
 			return
@@ -55,60 +80,138 @@ class GnoteProvider(object):
 			print("libgnote.__init__(): failed to locate Gnote")
 			self.path = None
 
-	def search(self, item):
+	def key(self, author, year):
 
 		"""
-		Search gnote for a note matching an author and a year
+		Arguments:
+		author -- an author name, such as "Smith" or "Smith, J.", or a
+				  heading such as "Smith, J. (2001)"
+		year -- a year
+
+		Returns:
+		The index key for an author and a year, which consists of the first
+		word of the last name, without punctuation, or None if there is no
+		name
 		"""
 
-		if self.path == None:
+		words = re.findall(r"[^\W\d_]+", author.split(",")[0].casefold())
+		if not words:
 			return None
+		return words[0], year
 
-		# Compile some regexps to search for the note,
-		# extract the note and remove xml tags
-		p = re.compile(r"<bold>%s.*\(%s\)" % (item.authors[0], item.date), re.IGNORECASE)
-		get_note = re.compile(r"<bold>%s.*?\(%s\).*?<bold>" % (item.authors[0], item.date), re.IGNORECASE and re.DOTALL)
-		strip_p = re.compile('<.*?>')
-		matches = []
+	def parse(self, note_path):
 
-		# Walk through all notes
-		for fnote in os.listdir(self.path):
+		"""
+		Extracts the notes about items from a Gnote note
 
-			if os.path.splitext(fnote)[1] == ".note":
+		Arguments:
+		note_path -- the path of the note
+
+		Returns:
+		A list of (key, heading, preview) tuples, where heading is the
+		case-folded text of the bold heading, and preview the text of the
+		note without tags
+		"""
 
-				note_path = os.path.join(self.path, fnote)
+		with open(note_path, "r", encoding="utf-8", errors="replace") as f:
+			s = f.read()
+		end = s.find("</note-content>")
+		if end < 0:
+			end = len(s)
+		entries = []
+		for m in heading.finditer(s, 0, end):
+			text = strip_p.sub("", m.group(1))
+			for year in heading_year.findall(text):
+				key = self.key(text, year)
+				if key is None:
+					continue
+				# The note runs until the next heading, after the year
+				year_end = s.find("(%s)" % year, m.start()) + len(year) + 2
+				next_heading = s.find("<bold>", year_end, end)
+				if next_heading < 0:
+					next_heading = end
+				preview = strip_p.sub("", s[m.start():next_heading])[:1024]
+				entries.append((key, text.casefold(), preview.strip()))
+		return entries
+
+	def refresh(self):
 
-				# Read the contents of the note
-				f = open(note_path, "r")
-				s = f.read()
+		"""
+		Re-parses the notes that were added or changed since the last
+		refresh, and forgets the ones that were removed
+		"""
 
-				# Search the note according to the regular expression
-				m = p.search(s)
+		if self.path is None:
+			return
+		with self.lock:
+			now = time.time()
+			try:
+				folderMtime = os.stat(self.path).st_mtime
+			except OSError:
+				return
+			if folderMtime == self.folderMtime and \
+				now - self.lastRefresh < self.refreshInterval:
+				return
+			self.folderMtime = folderMtime
+			self.lastRefresh = now
+			files = {}
+			changed = False
+			for entry in os.scandir(self.path):
+				if os.path.splitext(entry.name)[1] != ".note":
+					continue
+				try:
+					mtime = entry.stat().st_mtime
+				except OSError:
+					continue
+				old = self.files.get(entry.path)
+				if old is not None and old[0] == mtime:
+					files[entry.path] = old
+					continue
+				try:
+					files[entry.path] = mtime, self.parse(entry.path)
+				except (OSError, ValueError) as e:
+					print("libgnote.refresh(): failed to read %s: %s"
+						% (entry.path, e))
+					continue
+				changed = True
+			if not changed and len(files) == len(self.files):
+				return
+			index = {}
+			for note_path, (mtime, entries) in files.items():
+				for key, heading, preview in entries:
+					index.setdefault(key, []).append(
+						(heading, preview, note_path))
+			self.files = files
+			self.index = index
+			self.generation += 1
+			print("libgnote.refresh(): indexed %d notes in %.3fs"
+				% (len(files), time.time() - now))
 
-				# If a contains a match
-				if m != None:
+	def search(self, item):
 
-					# Extract the matching content
-					s = s[m.span()[0]:]
-					m = get_note.search(s[:s.find("</note-content>")])
-					if m != None:
-						start, end = m.span()
-					else:
-						start = 0
-						end = len(s)
-					pango = s[start:end]
+		"""
+		Search gnote for a note matching an author and a year
+		"""
 
-					# Remove tags, strip whitespaces and highlight the
-					# search terms
-					pango = strip_p.sub("", pango)[:1024].strip()
-					for s in (item.authors[0], item.date):
-						try:
-							pango = pango.replace("%s" % s, "<b>%s</b>" % s)
-						except:
-							pass
+		if self.path == None or not item.authors or item.date is None:
+			return None
 
-					# Add this result to the list
-					matches.append(GnoteNote(pango, "gnote --open-note=%s" % note_path))
+		self.refresh()
+		key = self.key(item.authors[0], item.date)
+		if key is None:
+			return None
+		author = item.authors[0].casefold()
+		matches = []
+		for heading, preview, note_path in self.index.get(key, ()):
+			# The heading should start with the full author name
+			if not heading.startswith(author):
+				continue
+			# Highlight the search terms
+			pango = preview
+			for s in (item.authors[0], item.date):
+				pango = pango.replace("%s" % s, "<b>%s</b>" % s)
+			# Add this result to the list
+			matches.append(GnoteNote(pango, "gnote --open-note=%s" % note_path))
 
 		if len(matches) == 0:
 			return None
@@ -126,6 +229,7 @@ class GnoteProvider(object):
 
 		return matches[0]
 
+
 class GnoteNote:
 
 	"""
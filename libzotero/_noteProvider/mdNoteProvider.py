@@ -0,0 +1,346 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+
+import os
+import os.path
+import pickle
+import platform
+import re
+import subprocess
+import threading
+import time
+from libqnotero.config import configFolder
+
+# Front-matter fields that hold citation keys, authors, years and DOIs
+key_fields = u"citekey", u"citation-key", u"citationkey", u"zotero-key", \
+	u"key", u"id"
+author_fields = u"author", u"authors"
+year_fields = u"year", u"date"
+doi_fields = u"doi",
+
+# Citation keys such as smith2001 or smithModels2001a
+citekey_author_year = re.compile(r"^([^\W\d_]+).*?(\d{4})[a-z]?$")
+heading_year = re.compile(r"\((\d{4})\)")
+doi_pattern = re.compile(r"\b(10\.\d{4,}/\S+)")
+markdown_extensions = u".md", u".markdown", u".mdown", u".mkd"
+
+
+class MdNoteProvider(object):
+
+	"""
+	Provides notes from a folder of Markdown files. Notes are found by the
+	citation key, the DOI, or the first author and year of an item, which
+	are read from the front matter, the file name and the first heading of
+	each note.
+
+	Only the start of every note is read, and the results are kept in a
+	cache in the settings folder, so that only notes that changed since the
+	last run are read again. The folder is checked for changes at most every
+	refreshInterval seconds. The generation is increased whenever notes are
+	added, changed or removed, so that notes that were looked up before can
+	be looked up again.
+	"""
+
+	refreshInterval = 5
+	# The number of lines after the front matter that are read
+	maxBodyLines = 20
+	maxPreviewLength = 1024
+	cacheVersion = 1
+
+	def __init__(self, qnotero, path):
+
+		"""
+		Constructor
+
+		Arguments:
+		qnotero -- a Qnotero instance
+		path -- the folder with the Markdown notes
+		"""
+
+		self.path = path if path and os.path.isdir(path) else None
+		self.files = {}
+		self.keys = {}
+		self.dois = {}
+		self.authorYears = {}
+		self.lastRefresh = 0
+		self.generation = 0
+		self.lock = threading.Lock()
+		self.cachePath = os.path.join(configFolder(), u"mdnotes.pickle")
+		if self.path is None:
+			print(u"mdNoteProvider.__init__(): invalid notes folder %s" % path)
+			return
+		print(u"mdNoteProvider.__init__(): notes path is %s" % self.path)
+		self.loadCache()
+
+	def loadCache(self):
+
+		"""Restores the notes that were read in an earlier run"""
+
+		try:
+			with open(self.cachePath, u"rb") as fd:
+				version, path, files = pickle.load(fd)
+		except (OSError, EOFError, ValueError, pickle.UnpicklingError) as e:
+			print(u"mdNoteProvider.loadCache(): no cache (%s)" % e)
+			return
+		if version == self.cacheVersion and path == self.path:
+			self.files = files
+
+	def saveCache(self):
+
+		"""Stores the notes that have been read"""
+
+		try:
+			os.makedirs(os.path.dirname(self.cachePath), exist_ok=True)
+			tmpPath = self.cachePath + u".tmp"
+			with open(tmpPath, u"wb") as fd:
+				pickle.dump((self.cacheVersion, self.path, self.files), fd,
+					pickle.HIGHEST_PROTOCOL)
+			os.replace(tmpPath, self.cachePath)
+		except OSError as e:
+			print(u"mdNoteProvider.saveCache(): failed to save cache (%s)" % e)
+
+	def parseValue(self, value):
+
+		"""
+		Arguments:
+		value -- a front-matter value
+
+		Returns:
+		A list of strings
+		"""
+
+		value = value.strip()
+		if value.startswith(u"[") and value.endswith(u"]"):
+			values = value[1:-1].split(u",")
+		else:
+			values = [value]
+		return [v.strip().strip(u"\"'") for v in values if v.strip()]
+
+	def parse(self, notePath):
+
+		"""
+		Reads the front matter and the start of a note, line by line
+
+		Arguments:
+		notePath -- the path of the note
+
+		Returns:
+		A (keys, dois, authorYears, preview) tuple
+		"""
+
+		fields = {}
+		body = []
+		with open(notePath, u"r", encoding=u"utf-8", errors=u"replace") as fd:
+			line = fd.readline()
+			if line.strip() == u"---":
+				# A YAML front matter with simple values and lists
+				field = None
+				for line in fd:
+					if line.strip() in (u"---", u"..."):
+						break
+					if line.lstrip().startswith(u"- ") and field is not None:
+						fields[field] += self.parseValue(line.lstrip()[2:])
+						continue
+					name, sep, value = line.partition(u":")
+					if not sep or line[:1].isspace():
+						continue
+					field = name.strip().casefold()
+					fields[field] = self.parseValue(value)
+				line = fd.readline()
+			for i in range(self.maxBodyLines):
+				if not line:
+					break
+				body.append(line.rstrip(u"\n"))
+				line = fd.readline()
+		stem = os.path.splitext(os.path.basename(notePath))[0]
+		keys = {stem.lstrip(u"@").casefold()}
+		for field in key_fields:
+			keys.update(v.lstrip(u"@").casefold() for v in fields.get(field, ()))
+		dois = set()
+		for field in doi_fields:
+			dois.update(v.casefold() for v in fields.get(field, ()))
+		dois.update(m.casefold() for m in doi_pattern.findall(u"\n".join(body)))
+		authorYears = set()
+		years = [v[:4] for field in year_fields for v in fields.get(field, ())]
+		for field in author_fields:
+			for author in fields.get(field, ())[:1]:
+				for year in years:
+					authorYears.add(self.authorYear(author, year,
+						fullName=True))
+		# Notes named after a citation key, or with a heading like
+		# "Smith et al. (2001)"
+		for key in keys:
+			m = citekey_author_year.match(key)
+			if m is not None:
+				authorYears.add((m.group(1), m.group(2)))
+		for line in body:
+			if line.startswith(u"#"):
+				heading = line.lstrip(u"#").strip()
+				for year in heading_year.findall(heading):
+					authorYears.add(self.authorYear(heading, year))
+				break
+		authorYears.discard(None)
+		preview = u"\n".join(body).strip()[:self.maxPreviewLength]
+		return tuple(keys), tuple(dois), tuple(authorYears), preview
+
+	def authorYear(self, author, year, fullName=False):
+
+		"""
+		Arguments:
+		author -- an author name, such as "Smith" or "Smith, J.", or a
+				  heading such as "Smith et al. (2001)"
+		year -- a year
+
+		Keyword arguments:
+		fullName -- indicates that a name without a comma starts with the
+					first name, as in "Jan Smith" (default=False)
+
+		Returns:
+		A normalized (last name, year) tuple, or None if there is no name
+		"""
+
+		lastNameFirst = u"," in author or not fullName
+		words = re.findall(r"[^\W\d_]+", author.split(u",")[0].casefold())
+		if not words:
+			return None
+		return words[0] if lastNameFirst else words[-1], year
+
+	def refresh(self):
+
+		"""
+		Reads the notes that were added or changed since the last refresh,
+		and forgets the ones that were removed
+		"""
+
+		if self.path is None:
+			return
+		with self.lock:
+			now = time.time()
+			if now - self.lastRefresh < self.refreshInterval:
+				return
+			self.lastRefresh = now
+			files = {}
+			changed = 0
+			for dirpath, dirnames, filenames in os.walk(self.path):
+				# Skip hidden folders, such as .git and .obsidian
+				dirnames[:] = [d for d in dirnames if not d.startswith(u".")]
+				for filename in filenames:
+					if os.path.splitext(filename)[1].lower() not in \
+						markdown_extensions:
+						continue
+					notePath = os.path.join(dirpath, filename)
+					try:
+						stats = os.stat(notePath)
+					except OSError:
+						continue
+					old = self.files.get(notePath)
+					if old is not None and old[:2] == \
+						(stats.st_mtime, stats.st_size):
+						files[notePath] = old
+						continue
+					try:
+						files[notePath] = (stats.st_mtime, stats.st_size) + \
+							self.parse(notePath)
+					except (OSError, ValueError) as e:
+						print(u"mdNoteProvider.refresh(): failed to read %s: %s"
+							% (notePath, e))
+						continue
+					changed += 1
+			removed = len(files) != len(self.files)
+			if not changed and not removed and self.keys:
+				return
+			keys = {}
+			dois = {}
+			authorYears = {}
+			for notePath, (mtime, size, _keys, _dois, _authorYears, preview) \
+				in files.items():
+				for key in _keys:
+					keys.setdefault(key, notePath)
+				for doi in _dois:
+					dois.setdefault(doi, notePath)
+				for authorYear in _authorYears:
+					authorYears.setdefault(authorYear, []).append(notePath)
+			self.files = files
+			self.keys = keys
+			self.dois = dois
+			self.authorYears = authorYears
+			self.generation += 1
+			print(u"mdNoteProvider.refresh(): %d notes, %d read in %.3fs"
+				% (len(files), changed, time.time() - now))
+			if changed or removed:
+				self.saveCache()
+
+	def search(self, item):
+
+		"""
+		Searches for a note about an item, by citation key, DOI, and first
+		author and year, in that order
+
+		Arguments:
+		item -- a zoteroItem
+
+		Returns:
+		An MdNote, or None if there is no note about the item
+		"""
+
+		if self.path is None:
+			return None
+		self.refresh()
+		notePath = None
+		if item.key is not None:
+			notePath = self.keys.get(item.key.casefold())
+		if notePath is None and item.doi is not None:
+			notePath = self.dois.get(item.doi.casefold())
+		if notePath is None and item.authors and item.date is not None:
+			authorYear = self.authorYear(item.authors[0], item.date)
+			notePaths = self.authorYears.get(authorYear, ())
+			if len(notePaths) > 1:
+				print(u"mdNoteProvider.search(): %d notes match %s (%s)"
+					% (len(notePaths), item.authors[0], item.date))
+			if notePaths:
+				notePath = sorted(notePaths)[0]
+		if notePath is None:
+			return None
+		preview = self.files[notePath][-1]
+		return MdNote(preview.replace(u"&", u"&amp;").replace(u"<", u"&lt;"),
+			notePath)
+
+
+class MdNote(object):
+
+	"""
+	A class containing a note
+	"""
+
+	def __init__(self, preview, path):
+
+		self.preview = preview
+		self.path = path
+
+	def open(self):
+
+		"""Open the note with the default application"""
+
+		if platform.system() == u"Darwin":
+			subprocess.call((u"open", self.path))
+		elif platform.system() == u"Windows":
+			os.startfile(self.path)
+		else:
+			subprocess.call((u"xdg-open", self.path))
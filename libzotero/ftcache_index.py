@@ -0,0 +1,227 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+
+import mmap
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Runs of letters, digits and non-ASCII bytes are candidate words, which are
+# split into actual words once they have been decoded
+word_bytes = re.compile(rb"[0-9A-Za-z\x80-\xff]+")
+word_chars = re.compile(r"\w+")
+
+
+class ftCacheIndex(object):
+
+    """
+    A word index of the .zotero-ft-cache files in which Zotero stores the text
+    of attachments, so that attachment contents can be searched even if
+    Zotero's own fulltext tables have been pruned. The index is stored in a
+    private database, and only files that changed since they were last
+    indexed are read again.
+
+    Every thread uses its own connection.
+    """
+
+    cache_file = u".zotero-ft-cache"
+    # Longer words are most likely not words
+    max_word_length = 40
+
+    schema = u"""
+		create table if not exists files (
+			fileID integer primary key, mtime real, size integer);
+		create table if not exists words (
+			wordID integer primary key, word text unique);
+		create table if not exists fileWords (
+			wordID integer, fileID integer, primary key (wordID, fileID))
+			without rowid;
+		create index if not exists fileWords_fileID on fileWords (fileID);
+		"""
+
+    # See LibZotero.fulltext_query
+    search_query = u"""
+		select distinct %d, fileID from fileWords
+		where wordID in (select wordID from words
+			where word >= ? and word < ?)
+		"""
+
+    def __init__(self, path):
+
+        """
+        Constructor.
+
+        Arguments:
+        path	--	The path of the database.
+        """
+
+        self.path = path
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self.connection()
+        conn.execute(u"pragma journal_mode=wal")
+        conn.executescript(self.schema)
+
+    def connection(self):
+
+        """
+        Returns:
+        The connection of the current thread.
+        """
+
+        conn = getattr(self.local, u"conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            # The index can be rebuilt, so it doesn't need to survive a crash
+            conn.execute(u"pragma synchronous=normal")
+            self.local.conn = conn
+        return conn
+
+    def read_words(self, path):
+
+        """
+        Reads the words from a file. The file is mapped into memory rather
+        than read, and only the individual words are decoded.
+
+        Arguments:
+        path	--	The path of the file.
+
+        Returns:
+        A set of case-folded words.
+        """
+
+        words = set()
+        with open(path, u"rb") as fd:
+            if os.fstat(fd.fileno()).st_size == 0:
+                return words
+            with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                for match in word_bytes.finditer(data):
+                    token = match.group().decode(u"utf-8", u"ignore")
+                    for word in word_chars.findall(token.casefold()):
+                        if 1 < len(word) <= self.max_word_length:
+                            words.add(word)
+        return words
+
+    def update(self, storage_path, attachment_keys, should_stop=None):
+
+        """
+        Indexes the cache files that were added or changed since the last
+        update, and forgets the ones that were removed.
+
+        Arguments:
+        storage_path	--	The storage folder of Zotero.
+        attachment_keys	--	A dict that maps the ids of the attachments onto
+                            their keys, which are also the names of their
+                            folders in the storage folder.
+
+        Keyword arguments:
+        should_stop		--	A function that returns True when indexing should
+                            be interrupted. Files that have been indexed up to
+                            then are kept. (default=None)
+
+        Returns:
+        The number of files that were indexed or removed.
+        """
+
+        t = time.time()
+        conn = self.connection()
+        conn.execute(u"create temp table if not exists fileWordList "
+                     u"(word text)")
+        indexed = {file_id: (mtime, size) for file_id, mtime, size in
+                   conn.execute(u"select fileID, mtime, size from files")}
+        changed = 0
+        for file_id in set(indexed) - set(attachment_keys):
+            self.remove_file(conn, file_id)
+            changed += 1
+        for attachment_id, key in attachment_keys.items():
+            if should_stop is not None and should_stop():
+                print(u"ftcache_index.update(): interrupted")
+                break
+            path = os.path.join(storage_path, key, self.cache_file)
+            try:
+                stats = os.stat(path)
+            except OSError:
+                if attachment_id in indexed:
+                    self.remove_file(conn, attachment_id)
+                    changed += 1
+                continue
+            if indexed.get(attachment_id) == (stats.st_mtime, stats.st_size):
+                continue
+            try:
+                words = self.read_words(path)
+            except (OSError, ValueError) as e:
+                print(u"ftcache_index.update(): %s" % e)
+                continue
+            self.remove_file(conn, attachment_id)
+            # The words of the file are added in bulk, through a temporary
+            # table
+            conn.execute(u"delete from temp.fileWordList")
+            conn.executemany(u"insert into temp.fileWordList values (?)",
+                             [(word,) for word in words])
+            conn.execute(u"insert or ignore into words (word) "
+                         u"select word from temp.fileWordList")
+            conn.execute(u"insert into fileWords select wordID, ? from words "
+                         u"where word in temp.fileWordList", (attachment_id,))
+            conn.execute(u"insert into files values (?, ?, ?)",
+                         (attachment_id, stats.st_mtime, stats.st_size))
+            changed += 1
+            # Commit regularly, so that an interruption doesn't lose much
+            if changed % 100 == 0:
+                conn.commit()
+        conn.commit()
+        print(u"ftcache_index.update(): indexed %d files in %.3fs"
+              % (changed, time.time() - t))
+        return changed
+
+    def remove_file(self, conn, file_id):
+
+        """
+        Removes a file from the index.
+
+        Arguments:
+        conn	--	A connection.
+        file_id	--	The id of the attachment.
+        """
+
+        conn.execute(u"delete from fileWords where fileID = ?", (file_id,))
+        conn.execute(u"delete from files where fileID = ?", (file_id,))
+
+    def search(self, words):
+
+        """
+        Finds the attachments that contain words starting with any of the
+        given words, in a single query.
+
+        Arguments:
+        words	--	A list of words.
+
+        Returns:
+        A list of (i, attachment id) tuples, where i is the index of the word
+        in the list.
+        """
+
+        query = u" union all ".join(self.search_query % i
+                                    for i in range(len(words)))
+        args = []
+        for word in words:
+            args += [word, word + u"\uffff"]
+        return self.connection().execute(query, args).fetchall()
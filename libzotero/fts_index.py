@@ -0,0 +1,256 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+
+import os
+import sqlite3
+import threading
+from libzotero.zotero_item import term_fields
+
+
+def fts_available():
+
+    """
+    Returns:
+    True if SQLite supports FTS5 with the trigram tokenizer, which requires
+    SQLite 3.34 or later, False otherwise.
+    """
+
+    try:
+        conn = sqlite3.connect(u":memory:")
+        conn.execute(u"create virtual table test using fts5(value, "
+                     u"tokenize='trigram case_sensitive 1')")
+        conn.close()
+    except sqlite3.Error:
+        return False
+    return True
+
+
+class ftsIndex(object):
+
+    """
+    A full-text index of the abstracts of the indexed items, in an FTS5 table
+    in a private database. Abstracts make up most of the searchable text, and
+    are kept out of the n-gram index, which is held in memory. The trigram
+    tokenizer allows any substring of at least three characters to be looked
+    up, and the values are stored case-folded, so that the index matches
+    exactly like zoteroItem.match().
+
+    Every thread uses its own connection. Changes only become visible to
+    searches once they are committed, along with the modification time of the
+    database from which they were indexed, so that a search can tell whether
+    the index matches the zoteroIndex that it searches.
+    """
+
+    fields = u"abstract",
+
+    def __init__(self, path):
+
+        """
+        Constructor.
+
+        Arguments:
+        path	--	The path of the database.
+        """
+
+        self.path = path
+        self.insert_query = u"insert into items (rowid, %s) values (?%s)" % (
+            u", ".join(self.fields), u", ?" * len(self.fields))
+        self.create_query = u"create virtual table if not exists items using " \
+            u"fts5(%s, tokenize='trigram case_sensitive 1')" % \
+            u", ".join(self.fields)
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        cur = self.connection().cursor()
+        cur.execute(u"pragma journal_mode=wal")
+        cur.execute(self.create_query)
+        cur.execute(u"create table if not exists meta (mtime)")
+        self.connection().commit()
+
+    def connection(self):
+
+        """
+        Returns:
+        The connection of the current thread.
+        """
+
+        conn = getattr(self.local, u"conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            self.local.conn = conn
+        return conn
+
+    def mtime(self):
+
+        """
+        Returns:
+        The modification time of the Zotero database from which the index
+        was built, or None if the index has not been built.
+        """
+
+        row = self.connection().execute(u"select mtime from meta").fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def rows(self, items):
+
+        """
+        Arguments:
+        items	--	An iterable of zoteroItems.
+
+        Returns:
+        A generator of tuples with the id and the values of the fields.
+        """
+
+        for item in items:
+            values = dict.fromkeys(self.fields)
+            for field, key in item.search_values():
+                if field in values:
+                    values[field] = key
+            yield (item.id,) + tuple(values[field] for field in self.fields)
+
+    def rebuild(self, items):
+
+        """
+        Replaces the contents of the index. The change is not visible until
+        commit() is called.
+
+        Arguments:
+        items	--	An iterable of zoteroItems.
+        """
+
+        conn = self.connection()
+        # Recreating the table is much faster than deleting all rows, which
+        # would need to be tokenized again
+        if not conn.in_transaction:
+            conn.execute(u"begin")
+        conn.execute(u"drop table if exists items")
+        conn.execute(self.create_query)
+        conn.executemany(self.insert_query, self.rows(items))
+
+    def update(self, item_ids, items):
+
+        """
+        Updates items in the index. The change is not visible until commit()
+        is called.
+
+        Arguments:
+        item_ids	--	The ids of the items that changed or were removed.
+        items		--	An iterable of the changed zoteroItems.
+        """
+
+        conn = self.connection()
+        conn.executemany(u"delete from items where rowid = ?",
+                         [(item_id,) for item_id in item_ids])
+        conn.executemany(self.insert_query, self.rows(items))
+
+    def commit(self, mtime):
+
+        """
+        Makes the changes visible to searches.
+
+        Arguments:
+        mtime	--	The modification time of the Zotero database from which
+                    the index was built.
+        """
+
+        conn = self.connection()
+        conn.execute(u"delete from meta")
+        conn.execute(u"insert into meta values (?)", (mtime,))
+        conn.commit()
+        # Don't leave a rebuilt index behind in the write-ahead log as well
+        conn.execute(u"pragma wal_checkpoint(truncate)")
+
+    def rollback(self):
+
+        """Discards the changes that have not been committed."""
+
+        self.connection().rollback()
+
+    def search(self, term_type, term, mtime):
+
+        """
+        Finds the items whose indexed fields match a search term.
+
+        Arguments:
+        term_type	--	The type of the term, or None to search all fields.
+        term		--	The search term.
+        mtime		--	The modification time of the zoteroIndex that is
+                        searched.
+
+        Returns:
+        A set of item ids, or None if the index was built from another
+        version of the database.
+        """
+
+        columns = [field for field in self.fields
+                   if field in term_fields.get(term_type, ())]
+        if not columns:
+            return set()
+        conn = self.connection()
+        # The modification time and the items are read from the same
+        # snapshot, so that an update that is committed in between is not
+        # mixed in
+        transaction = not conn.in_transaction
+        if transaction:
+            conn.execute(u"begin")
+        try:
+            row = conn.execute(u"select mtime from meta").fetchone()
+            if (row[0] if row is not None else None) != mtime:
+                return None
+            # Shorter terms don't contain a trigram, and are looked up by
+            # scanning the values
+            if len(term) < 3:
+                cur = conn.execute(u"select rowid from items where %s"
+                                   % u" or ".join(u"instr(%s, ?)" % column
+                                                  for column in columns),
+                                   [term] * len(columns))
+            else:
+                phrase = u"\"%s\"" % term.replace(u"\"", u"\"\"")
+                cur = conn.execute(
+                    u"select rowid from items where items match ?",
+                    (u"{%s} : %s" % (u" ".join(columns), phrase),))
+            return {row[0] for row in cur}
+        finally:
+            if transaction:
+                conn.commit()
+
+    def scan(self, items, term_type, term):
+
+        """
+        Finds the items whose indexed fields match a search term, without
+        using the index. This is used while the index doesn't match the
+        items.
+
+        Arguments:
+        items		--	An iterable of zoteroItems.
+        term_type	--	The type of the term, or None to search all fields.
+        term		--	The search term.
+
+        Returns:
+        A set of item ids.
+        """
+
+        fields = set(self.fields) & term_fields.get(term_type, set())
+        if not fields:
+            return set()
+        return {item.id for item in items
+                if any(field in fields and term in key
+                       for field, key in item.search_values())}
@@ -18,18 +18,29 @@
 
 #
 
+import gc
+import hashlib
 import sqlite3
 import os
 import os.path
+import pathlib
+import pickle
 import shutil
 import sys
+import threading
 import time
-from libqnotero.config import getConfig
-from libzotero.zotero_item import zoteroItem as zotero_item
+from libqnotero.config import getConfig, configFolder
+from libzotero.ftcache_index import ftCacheIndex as ftcache_index
+from libzotero.fts_index import ftsIndex as fts_index, fts_available
+from libzotero import ranking
+from libzotero.ngram_index import ngramIndex as ngram_index
+from libzotero.search_results import searchResults as search_results
+from libzotero.zotero_index import zoteroIndex as zotero_index
+from libzotero.zotero_item import search_fields
 
 term_index = {u"collection", u"tag", u"author", u"editor",
               u"date", u"year", u"publication", u"journal",
-              u"title", u"doi", u'abs'}
+              u"title", u"doi", u'abs', u"fulltext"}
 
 
 def parse_query(query):
@@ -54,7 +65,7 @@ def parse_query(query):
         query = query.replace(u": ", u":")
     # Parse the terms into a suitable format
     items = []
-    for item in query.strip().lower().split():
+    for item in query.strip().casefold().split():
         s = item.split(u":")
         # Check if the criterium is type-specified
         if len(s) == 2 and s[0].lower() in term_index:
@@ -73,6 +84,49 @@ def parse_query(query):
     return items
 
 
+def refines(terms, base_terms):
+
+    """
+    Checks whether a query can only match items that are also matched by
+    another query. This is the case when the query was obtained by typing on
+    after the other query, so that each of its terms is contained in a term
+    of the same type.
+
+    Arguments:
+    terms		--	The parsed query, as returned by parse_query().
+    base_terms	--	The other parsed query.
+
+    Returns:
+    True if the query refines the other query, False otherwise.
+    """
+
+    for base_type, base_term in base_terms:
+        for term_type, term in terms:
+            if term_type == base_type and base_term in term:
+                break
+        else:
+            return False
+    return True
+
+
+def bytes_read():
+
+    """
+    Returns:
+    The number of bytes that this process has read so far, or None if this
+    is not available on the current platform.
+    """
+
+    try:
+        with open(u"/proc/self/io") as fd:
+            for line in fd:
+                if line.startswith(u"rchar:"):
+                    return int(line.split()[1])
+    except (IOError, ValueError):
+        pass
+    return None
+
+
 def valid_location(path):
     """
 	Checks if a given path is a valid Zotero folder, i.e., if it it contains
@@ -96,87 +150,156 @@ class LibZotero(object):
 	original zoterotools.
 	"""
 
-    attachment_query = u"""
-		select items.itemID, itemAttachments.path, itemAttachments.itemID
-		from items, itemAttachments
-		where items.itemID = itemAttachments.parentItemID
+    # Items in the trash and retracted items are left out of the index
+    excluded_join = u"""
+			left join deletedItems
+				on deletedItems.itemID = items.itemID
+			left join retractedItems
+				on retractedItems.itemID = items.itemID
 		"""
 
+    excluded_clause = u"""
+			deletedItems.itemID is null
+			and retractedItems.itemID is null
+		"""
+
+    attachment_query = u"""
+		select items.itemID, itemAttachments.path, itemAttachments.itemID,
+			attachments.key
+		from items
+			join itemAttachments
+				on itemAttachments.parentItemID = items.itemID
+			join items as attachments
+				on attachments.itemID = itemAttachments.itemID
+			%s
+		where
+			%s
+			%%s
+		""" % (excluded_join, excluded_clause)
+
+    fields_query = u"select fieldID, fieldName from fields"
+
     info_query = u"""
-    		select items.itemID, items.itemTypeID, fields.fieldName, itemDataValues.value, items.key
-    		from items, itemData, fields, itemDataValues
-    		where
-    			items.itemID = itemData.itemID
-    			and itemData.fieldID = fields.fieldID
-    			and itemData.valueID = itemDataValues.valueID
-    			and (fields.fieldName = "date"
-    			    or fields.fieldName = "title"
-    				or fields.fieldName = "publicationTitle"
-    				or fields.fieldName = "programTitle"
-    				or fields.fieldName = "websiteTitle"
-    				or fields.fieldName = "proceedingsTitle"
-    				or fields.fieldName = "forumTitle"
-    				or fields.fieldName = "encyclopediaTitle"
-    				or fields.fieldName = "dictionaryTitle"
-    				or fields.fieldName = "bookTitle"
-    				or fields.fieldName = "blogTitle"
-    				or fields.fieldName = "subject"
-    				or fields.fieldName = "url"
-    				or fields.fieldName = "abstractNote"
-    				or fields.fieldName = "DOI"
-    				or fields.fieldName = "volume"
-    				or fields.fieldName = "issue")
-    		"""
-
-    author_query = u"""
+		select items.itemID, itemData.fieldID, itemDataValues.value, items.key
+		from items
+			join itemData on itemData.itemID = items.itemID
+			join itemDataValues on itemDataValues.valueID = itemData.valueID
+			%s
+		where
+			%s
+			and items.itemTypeID not in (select itemTypeID from itemTypes
+				where typeName = "attachment")
+			and itemData.fieldID in (%%s)
+			%%s
+		""" % (excluded_join, excluded_clause)
+
+    creator_query = u"""
 		select items.itemID, creators.lastName
-		from items, itemCreators, creators, creatorTypes
+		from items
+			join itemCreators on itemCreators.itemID = items.itemID
+			join creators on creators.creatorID = itemCreators.creatorID
+			join creatorTypes
+				on creatorTypes.creatorTypeID = itemCreators.creatorTypeID
+			%s
 		where
-			items.itemID = itemCreators.itemID
-			and itemCreators.creatorID = creators.creatorID
-			and itemCreators.creatorTypeID = creatorTypes.creatorTypeID
-			and creatorTypes.creatorType = "author"
+			%s
+			and creatorTypes.creatorType = "%%s"
+			%%s
 		order by itemCreators.orderIndex
-		"""
-
-    editor_query = u"""
-    		select items.itemID, creators.lastName
-    		from items, itemCreators, creators, creatorTypes
-    		where
-    			items.itemID = itemCreators.itemID
-    			and itemCreators.creatorID = creators.creatorID
-    			and itemCreators.creatorTypeID = creatorTypes.creatorTypeID
-    			and creatorTypes.creatorType = "editor"
-    		order by itemCreators.orderIndex
-    		"""
+		""" % (excluded_join, excluded_clause)
 
     collection_query = u"""
 		select items.itemID, collections.collectionName
-		from items, collections, collectionItems
+		from items
+			join collectionItems on collectionItems.itemID = items.itemID
+			join collections
+				on collections.collectionID = collectionItems.collectionID
+			%s
 		where
-			items.itemID = collectionItems.itemID
-			and collections.collectionID = collectionItems.collectionID
+			%s
+			%%s
 		order by collections.collectionName != "To Read",
 			collections.collectionName
-		"""
+		""" % (excluded_join, excluded_clause)
 
     tag_query = u"""
 		select items.itemID, tags.name
-		from items, tags, itemTags
+		from items
+			join itemTags on itemTags.itemID = items.itemID
+			join tags on tags.tagID = itemTags.tagID
+			%s
 		where
-			items.itemID = itemTags.itemID
-			and tags.tagID = itemTags.tagID
-		"""
+			%s
+			%%s
+		""" % (excluded_join, excluded_clause)
 
     deleted_query = u"select itemID from deletedItems"
 
     retracted_query = u"select itemID from retractedItems"
 
-    attachmentid_query = u"""select itemTypes.itemTypeID from itemTypes 
-                             where itemTypes.typeName = "attachment"
-                             """
+    # The indexed fields, mapped onto the zotero_item attributes in which they
+    # are stored. Not all items have the publicationTitle field, and subject
+    # corresponds to the email title.
+    field_attributes = {
+        u"title": u"title",
+        u"subject": u"title",
+        u"publicationTitle": u"publication",
+        u"bookTitle": u"publication",
+        u"blogTitle": u"publication",
+        u"encyclopediaTitle": u"publication",
+        u"proceedingsTitle": u"publication",
+        u"programTitle": u"publication",
+        u"dictionaryTitle": u"publication",
+        u"date": u"date",
+        u"volume": u"volume",
+        u"issue": u"issue",
+        u"DOI": u"doi",
+        u"url": u"url",
+        u"abstractNote": u"abstract",
+    }
+
+    item_state_query = u"""
+		select itemID, dateModified, clientDateModified, version from items
+		"""
+
+    collection_state_query = u"""
+		select collectionID, collectionName, clientDateModified
+		from collections
+		"""
+
+    attachment_parent_query = u"""
+		select parentItemID from itemAttachments
+		where parentItemID is not null
+			and itemID in (select itemID from temp.changedItems)
+		"""
+
+    # Zotero's index of the words in attachments. Words are matched by
+    # prefix, which uses the index on fulltextWords.word. The first column
+    # identifies the word in a batch of words.
+    fulltext_query = u"""
+		select distinct %d, itemID from fulltextItemWords
+		where wordID in (select wordID from fulltextWords
+			where word >= ? and word < ?)
+		"""
+
+    # Restricts the indexing queries to the items in the changedItems table
+    changed_clause = \
+        u"and items.itemID in (select itemID from temp.changedItems)"
+
+    # The modes that are tried, in order, to open the database when the
+    # zoteroDatabaseMode setting is "auto". The backup mode is left out,
+    # because it loads the full database (including the fulltext tables) into
+    # memory.
+    database_modes = u"readonly", u"immutable", u"copy"
+    # The modes that see the changes in the write-ahead log, rather than
+    # only those in the database itself
+    wal_modes = u"readonly", u"backup"
+
+    # The version of the index format, which needs to be increased whenever
+    # the format changes, so that existing cache files are discarded.
+    index_cache_version = 8
 
-    def __init__(self, zotero_path, noteProvider=None):
+    def __init__(self, zotero_path, noteProvider=None, autoUpdate=True):
 
         """
 		Intialize libzotero.
@@ -186,6 +309,11 @@ class LibZotero(object):
 
 		Keyword arguments:
 		noteProvider	--	A noteProvider object. (default=None)
+		autoUpdate		--	Indicates whether the index is brought up to date
+							when libzotero is initialized and before every
+							search. If not, update() needs to be called
+							separately, for example from a background thread.
+							(default=True)
 		"""
 
         assert (isinstance(zotero_path, str))
@@ -196,6 +324,7 @@ class LibZotero(object):
         self.storage_path = os.path.join(self.zotero_path, u"storage")
         self.zotero_database = os.path.join(self.zotero_path, u"zotero.sqlite")
         self.noteProvider = noteProvider
+        self.autoUpdate = autoUpdate
         if os.name == u"nt":
             home_folder = os.environ[u"USERPROFILE"]
         elif os.name == u"posix":
@@ -204,8 +333,6 @@ class LibZotero(object):
             print(u"libzotero.__init__(): you appear to be running an unsupported OS")
 
         self.gnotero_database = os.path.join(home_folder, u".gnotero.sqlite")
-        # Remember search results so results speed up over time
-        self.search_cache = {}
         # Check whether verbosity is turned on
         self.verbose = "-v" in sys.argv
         # These dates are treated as special and are not parsed into a year
@@ -215,184 +342,705 @@ class LibZotero(object):
         # These extensions are recognized as fulltext attachments
         self.attachment_ext = u".pdf", u"epub", u'djvu', u'html'
 
-        self.index = {}
-        self.collection_index = []
-        self.tag_index = []
-        self.last_update = None
+        # Searches use the current index, which is only replaced once an update
+        # has been completed. Only one update can run at a time.
+        self.zotero_index = None
+        self.publish(zotero_index(noteProvider))
+        self.update_lock = threading.Lock()
+        # The index is also stored on disk, so that it doesn't need to be
+        # rebuilt from the database at every start. This file and the private
+        # databases below belong to one Zotero database.
+        self.index_cache = self.private_file(u"index.cache")
+        # Abstracts are searched through a full-text index in a private
+        # database, if SQLite supports this. The other fields are kept in the
+        # n-gram index.
+        self.fts = None
+        if fts_available():
+            try:
+                self.fts = fts_index(self.private_file(u"search.sqlite"))
+            except Exception as e:
+                print(u"libzotero.__init__(): failed to open full-text "
+                      u"index: %s" % e)
+        # The text of attachments that Zotero caches in the storage folder can
+        # be indexed as well
+        self.ftcache = None
+        if getConfig(u"ftCacheIndex"):
+            try:
+                self.ftcache = ftcache_index(
+                    self.private_file(u"ftcache.sqlite"))
+            except Exception as e:
+                print(u"libzotero.__init__(): failed to open attachment "
+                      u"index: %s" % e)
+        if self.fts is None:
+            self.ngram_fields = tuple(search_fields)
+        else:
+            self.ngram_fields = tuple(field for field in search_fields
+                                      if field not in self.fts.fields)
+        if getConfig(u"indexCache"):
+            self.load_cache()
+        # Keep track of how often a search is narrowed down from the results
+        # of a previous search
+        self.searches = 0
+        self.refined_searches = 0
+        # Every thread that searches attachment contents keeps a connection to
+        # the database
+        self.fulltext_local = threading.local()
+        self.error = False
+        if not autoUpdate:
+            return
 
         # The notry parameter can be used to show errors which would
         # otherwise be obscured by the try clause
         if "--notry" in sys.argv:
-            self.search(u"dummy")
+            self.update()
 
         # Start by updating the database
         try:
-            self.search(u"dummy")
+            self.update()
             self.error = False
         except Exception as e:
             print(e)
             self.error = True
 
-    def update(self, force=False):
+    @property
+    def index(self):
 
-        """
-		Checks if the local copy of the zotero database is up to date. If not,
-		the data is also indexed.
+        """The indexed items, as a dict of zotero_items by item id."""
+
+        return self.zotero_index.items
+
+    @property
+    def collection_index(self):
+
+        """The indexed collections, with the number of items in each."""
+
+        return self.zotero_index.collection_index
+
+    @property
+    def tag_index(self):
 
+        """The indexed tags, with the number of items that have each tag."""
+
+        return self.zotero_index.tag_index
+
+    def private_file(self, name):
+
+        """
 		Arguments:
-		force		--	Indicates that the data should also be indexed, even
-						if the local copy is up to date. (default=False)
+		name	--	The name of a file in which data from the database is kept.
+
+		Returns:
+		The path of the file in the configuration folder, with a hash of the
+		path of the database in its name, so that different libraries or
+		profiles don't overwrite each other's files.
 		"""
 
+        digest = hashlib.sha1(os.fsencode(os.path.realpath(
+            self.zotero_database))).hexdigest()[:12]
+        base, ext = os.path.splitext(name)
+        return os.path.join(configFolder(), u"%s-%s%s" % (base, digest, ext))
+
+    def database_files(self):
+
+        """
+		Returns:
+		The paths of the zotero database, and of the write-ahead log and the
+		rollback journal, which Zotero may write to without modifying the
+		database itself.
+		"""
+
+        return [self.zotero_database + suffix
+                for suffix in (u"", u"-wal", u"-journal")]
+
+    def database_mtime(self, wal=True):
+
+        """
+		Keyword arguments:
+		wal		--	Indicates whether the write-ahead log and the rollback
+					journal should be taken into account. (default=True)
+
+		Returns:
+		The latest modification time of the database files.
+
+		Raises:
+		OSError if the database doesn't exist.
+		"""
+
+        mtime = os.stat(self.zotero_database).st_mtime
+        if not wal:
+            return mtime
+        for path in self.database_files()[1:]:
+            try:
+                mtime = max(mtime, os.stat(path).st_mtime)
+            except OSError:
+                pass
+        return mtime
+
+    def needs_update(self):
+
+        """
+		Returns:
+		True if the zotero database was modified since the last update, False
+		otherwise.
+		"""
+
+        index = self.zotero_index
         try:
-            stats = os.stat(self.zotero_database)
+            current = self.database_mtime(index.wal)
         except Exception as e:
-            print(u"libzotero.update(): %s" % e)
+            print(u"libzotero.needs_update(): %s" % e)
             return False
+        return index.mtime is None or current > index.mtime
+
+    def update(self, force=False, progress=None):
 
-        # Only update if necessary
-        if force or self.last_update is None or stats[8] > self.last_update:
+        """
+		Checks if the index is up to date with the zotero database. If not,
+		the data is indexed. Only the items that were added, modified or
+		removed since the last update are re-indexed, unless the changes are
+		too extensive for that to pay off. The new index is built off to the
+		side, and replaces the current index once it is complete.
+
+		Keyword arguments:
+		force		--	Indicates that the data should be fully re-indexed, even
+						if the index is up to date. (default=False)
+		progress	--	A function that is called with the progress of the
+						update as a percentage. (default=None)
+		"""
+
+        with self.update_lock:
+            current = self.zotero_index
+            try:
+                stats = os.stat(self.zotero_database)
+                mtime = self.database_mtime()
+            except Exception as e:
+                print(u"libzotero.update(): %s" % e)
+                return False
+
+            # Only update if necessary. Changes in the write-ahead log don't
+            # count if the last update couldn't see them anyway.
+            if not force and current.mtime is not None and \
+                    (mtime if current.wal else stats.st_mtime) <= \
+                    current.mtime:
+                # An index that was loaded from the cache is prepared here, so
+                # that this doesn't hold up the thread that loaded it
+                self.prepare_ranking(current)
+                if self.fts is not None and self.fts.mtime() != current.mtime:
+                    print(u"libzotero.update(): rebuilding full-text index")
+                    try:
+                        self.fts.rebuild(current.items.values())
+                    except Exception:
+                        self.fts.rollback()
+                        raise
+                    self.fts.commit(current.mtime)
+                return True
             t = time.time()
-            self.last_update = stats[8]
-            self.index = {}
-            self.collection_index = []
-            self.search_cache = {}
-            # Copy the zotero database to the gnotero copy
-            shutil.copyfile(self.zotero_database, self.gnotero_database)
-            self.conn = sqlite3.connect(self.gnotero_database)
-            self.cur = self.conn.cursor()
-            # First create a list of deleted items, so we can ignore those later
-            deleted = []
-            self.cur.execute(self.deleted_query)
-            for item in self.cur.fetchall():
-                deleted.append(item[0])
-            # Then create a list of retracted item to ignore them too
-            retracted = []
-            self.cur.execute(self.retracted_query)
-            for item in self.cur.fetchall():
-                retracted.append(item[0])
-            # Retrieve the attachment ID
-            self.cur.execute(self.attachmentid_query)
-            item = self.cur.fetchone()
-            attachmentid = item[0]
-            # Retrieve information about date, publication, volume, issue, DOI,
-            # title, and abstract.
-            self.cur.execute(self.info_query)
-            for item in self.cur.fetchall():
-                # If the item is marked as attachment just continue to the next one
-                if item[1] == attachmentid:
-                    continue
-                item_id = item[0]
-                key = item[4]
-                if item_id not in deleted and item_id not in retracted:
-                    item_name = item[2]
-                    # Parse date fields, because we only want a year or a
-                    # 'special' date
-                    if item_name == u"date":
-                        item_value = None
-                        for sd in self.special_dates:
-                            if sd in item[3].lower():
-                                item_value = sd
-                                break
-                        item_value = item[3][0:4]
-                    else:
-                        item_value = item[3]
-                    if item_id not in self.index:
-                        self.index[item_id] = zotero_item(item_id,
-                                                          noteProvider=self.noteProvider)
-                        self.index[item_id].key = key
-                    # Not all items have the publicationTitle field
-                    if item_name == u"publicationTitle" or item_name == u"bookTitle"\
-                            or item_name == u"blogTitle" or item_name == u"encyclopediaTitle"\
-                            or item_name == u"proceedingsTitle" or item_name == u"programTitle"\
-                            or item_name == u"dictionaryTitle":
-                        self.index[item_id].publication = str(item_value)
-                    elif item_name == u"date":
-                        self.index[item_id].date = item_value
-                    elif item_name == u"volume":
-                        self.index[item_id].volume = item_value
-                    elif item_name == u"issue":
-                        self.index[item_id].issue = item_value
-                    elif item_name == u"DOI":
-                        self.index[item_id].doi = item_value
-                        # subject corresponds to the email title
-                    elif item_name == u"title" or item_name == u"subject":
-                        self.index[item_id].title = str(item_value)
-                    elif item_name == u'url':
-                        self.index[item_id].url = item_value
-                    elif item_name == u'abstractNote':
-                        self.index[item_id].abstract = item_value
-            # Retrieve author information
-            self.cur.execute(self.author_query)
-            for item in self.cur.fetchall():
-                item_id = item[0]
-                if item_id not in deleted and item_id not in retracted:
-                    item_author = item[1].title()
-                    if item_id not in self.index:
-                        self.index[item_id] = zotero_item(item_id)
-                    self.index[item_id].authors.append(item_author)
-            # Retrieve editor information
-            self.cur.execute(self.editor_query)
-            for item in self.cur.fetchall():
-                item_id = item[0]
-                if item_id not in deleted and item_id not in retracted:
-                    item_editor = item[1].title()
-                    if item_id not in self.index:
-                        self.index[item_id] = zotero_item(item_id)
-                    self.index[item_id].editors.append(item_editor)
-            # Retrieve collection information
-            self.cur.execute(self.collection_query)
-            for item in self.cur.fetchall():
-                item_id = item[0]
-                if item_id not in deleted and item_id not in retracted:
-                    item_collection = item[1]
-                    if item_id not in self.index:
-                        self.index[item_id] = zotero_item(item_id)
-                    self.index[item_id].collections.append(item_collection)
-                    if item_collection not in self.collection_index:
-                        self.collection_index.append(item_collection)
-            # Retrieve tag information
-            self.cur.execute(self.tag_query)
-            for item in self.cur.fetchall():
-                item_id = item[0]
-                # Only add tags for existing entries in the index
-                if item_id in self.index:
-                    item_tag = item[1]
-                    self.index[item_id].tags.append(item_tag)
-                    if item_tag not in self.tag_index:
-                        self.tag_index.append(item_tag)
-            # Retrieve attachments
-            self.cur.execute(self.attachment_query)
-            for item in self.cur.fetchall():
-                item_id = item[0]
-                if item_id not in deleted and item_id not in retracted:
-                    if item[1] is not None:
-                        att = item[1]
-                        # If the attachment is stored in the Zotero folder, it is preceded
-                        # by "storage:"
-                        if att[:8] == u"storage:":
-                            item_attachment = att[8:]
-                            attachment_id = item[2]
-                            if item_attachment[-4:].lower() in \
-                                    self.attachment_ext:
-                                if item_id not in self.index:
-                                    self.index[item_id] = zotero_item(item_id)
-                                self.cur.execute(
-                                    u"select items.key from items where itemID = %d"
-                                    % attachment_id)
-                                key = self.cur.fetchone()[0]
-                                self.index[item_id].fulltext.append(os.path.join(
-                                    self.storage_path, key, item_attachment))
-                        # If the attachment is linked, it is simply the full
-                        # path to the attachment
-                        else:
-                            self.index[item_id].fulltext.append(att)
-            self.cur.close()
-            print(u"libzotero.update(): indexing completed in %.3fs"
-                  % (time.time() - t))
-            print(u"%s entries processed" % len(self.index))
+            read = bytes_read()
+            conn, mode = self.connect()
+            cur = conn.cursor()
+            try:
+                index = None
+                if not force and current.item_state:
+                    index = self.update_incremental(cur, current, progress)
+                if index is None:
+                    index = self.update_full(cur, progress)
+            except Exception:
+                if self.fts is not None:
+                    self.fts.rollback()
+                raise
+            finally:
+                cur.close()
+                conn.close()
+            # Changes that only exist in the write-ahead log are not indexed
+            # in the other modes, and are picked up once they are checkpointed
+            index.wal = mode in self.wal_modes
+            index.mtime = mtime if index.wal else stats.st_mtime
+            index.size = stats[6]
+            self.prepare_ranking(index)
+            self.commit(index)
+            if read is not None:
+                print(u"libzotero.update(): read %d bytes in %s mode in %.3fs"
+                      % (bytes_read() - read, mode, time.time() - t))
+            if self.verbose:
+                print(u"libzotero.update(): the index takes %d bytes"
+                      % index.memory_usage())
+            if getConfig(u"indexCache"):
+                self.save_cache(index)
+            if progress is not None:
+                progress(100)
+        return True
+
+    def load_cache(self):
+
+        """
+		Loads the index from the cache file. The cache is only used if it has
+		the current index format and was built from the same database. If the
+		database was modified since, the next update re-indexes the items that
+		changed.
+
+		Returns:
+		True if the cache was loaded, False otherwise.
+		"""
+
+        t = time.time()
+        # The garbage collector would otherwise repeatedly walk all the
+        # objects that are being loaded
+        gc.disable()
+        try:
+            with open(self.index_cache, u"rb") as fd:
+                cache = pickle.load(fd)
+            if cache[u"version"] != self.index_cache_version or \
+                    cache[u"database"] != self.zotero_database:
+                print(u"libzotero.load_cache(): discarding stale cache")
+                return False
+            stats = os.stat(self.zotero_database)
+            index = cache[u"index"]
+            if index.ngrams.fields != self.ngram_fields:
+                print(u"libzotero.load_cache(): discarding stale cache")
+                return False
+            index.set_note_provider(self.noteProvider)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            print(u"libzotero.load_cache(): discarding corrupt cache: %s" % e)
+            return False
+        finally:
+            gc.enable()
+        # The full-text index is stored separately, and may not have been
+        # saved along with the cache. If so, it is rebuilt by the next update,
+        # whether or not the database changed, and searched by scanning the
+        # items until then.
+        # A database that changed size without a new mtime is checked as well
+        if stats[6] != index.size:
+            index.mtime = 0
+        self.publish(index)
+        print(u"libzotero.load_cache(): loaded %d entries in %.3fs"
+              % (len(index.items), time.time() - t))
         return True
 
+    def prepare_ranking(self, index):
+
+        """
+		Collects the statistics for ranking search results, if results are
+		ranked, so that this is done by the thread that updates the index
+		rather than by the first search.
+
+		Arguments:
+		index		--	A zotero_index.
+		"""
+
+        if getConfig(u"rankResults"):
+            ranking.score_bounds(index, time.localtime().tm_year)
+
+    def publish(self, index):
+
+        """
+		Replaces the current index. Searches switch to the new index at once,
+		while searches that are running continue with the index they
+		started with. Neither index is modified afterwards.
+
+		Arguments:
+		index		--	A zotero_index that is complete.
+		"""
+
+        index.publish()
+        self.zotero_index = index
+
+    def commit(self, index):
+
+        """
+		Commits the changes to the full-text index that were made while
+		building an index, and publishes the index, as one step. This needs
+		to be called while update_lock is held. Searches only use the
+		full-text index if it was built from the same version of the database
+		as the index they search, so they never mix abstracts from one
+		version with items from another.
+
+		Arguments:
+		index		--	A zotero_index that is complete.
+		"""
+
+        if self.fts is not None:
+            self.fts.commit(index.mtime)
+        self.publish(index)
+
+    def save_cache(self, index):
+
+        """
+		Writes an index to the cache file.
+
+		Arguments:
+		index		--	A zotero_index.
+		"""
+
+        t = time.time()
+        cache = {
+            u"version": self.index_cache_version,
+            u"database": self.zotero_database,
+            u"index": index,
+        }
+        # Write to a temporary file first, so that an interrupted write
+        # doesn't leave a corrupt cache behind
+        path = self.index_cache + u".tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, u"wb") as fd:
+                pickle.dump(cache, fd, pickle.HIGHEST_PROTOCOL)
+            os.replace(path, self.index_cache)
+        except Exception as e:
+            print(u"libzotero.save_cache(): failed to save cache: %s" % e)
+            return
+        print(u"libzotero.save_cache(): saved cache in %.3fs"
+              % (time.time() - t))
+
+    def connect(self):
+
+        """
+		Opens the Zotero database, using the mode from the zoteroDatabaseMode
+		setting. Zotero keeps an exclusive lock on the database while it is
+		running, so if the database cannot be read in the selected mode, the
+		remaining modes are tried, with copying the database as last resort.
+		An unknown mode is treated as auto.
+
+		Returns:
+		A (connection, mode) tuple.
+		"""
+
+        mode = getConfig(u"zoteroDatabaseMode")
+        if mode not in (u"auto", u"backup") + self.database_modes:
+            print(u"libzotero.connect(): unknown database mode %r, using "
+                  u"auto" % (mode,))
+            mode = u"auto"
+        if mode == u"auto":
+            modes = self.database_modes
+        else:
+            modes = mode, u"copy"
+        for mode in modes:
+            try:
+                conn = self.connect_mode(mode)
+            except sqlite3.Error as e:
+                if mode == u"copy":
+                    raise
+                print(u"libzotero.connect(): cannot open database in %s "
+                      u"mode: %s" % (mode, e))
+                continue
+            return conn, mode
+
+    def connect_mode(self, mode):
+
+        """
+		Opens the database in a mode, and reads from it, because a lock only
+		shows once the database is actually read.
+
+		Arguments:
+		mode		--	One of database_modes.
+
+		Returns:
+		A connection.
+
+		Raises:
+		sqlite3.Error if the database cannot be read in this mode.
+		"""
+
+        conn = getattr(self, u"connect_%s" % mode)()
+        try:
+            conn.execute(u"select count(*) from sqlite_master").fetchone()
+        except sqlite3.Error:
+            conn.close()
+            raise
+        return conn
+
+    def database_uri(self, options):
+
+        """
+		Arguments:
+		options		--	The SQLite URI parameters, such as "mode=ro".
+
+		Returns:
+		A SQLite URI for the Zotero database.
+		"""
+
+        # Only absolute paths can be expressed as a URI
+        path = pathlib.Path(os.path.abspath(self.zotero_database))
+        return u"%s?%s" % (path.as_uri(), options)
+
+    def connect_readonly(self):
+
+        """
+		Returns:
+		A read-only connection to the live database.
+		"""
+
+        return sqlite3.connect(self.database_uri(u"mode=ro"), uri=True,
+                               timeout=.1)
+
+    def connect_immutable(self):
+
+        """
+		Returns:
+		A connection to the live database that ignores locks, because it
+		assumes that the database does not change while it is read.
+		"""
+
+        return sqlite3.connect(self.database_uri(u"mode=ro&immutable=1"),
+                               uri=True)
+
+    def connect_backup(self):
+
+        """
+		Returns:
+		A connection to an in-memory copy of the database, which is copied
+		page by page with the online backup API.
+		"""
+
+        def progress(status, remaining, total):
+
+            # The backup would otherwise wait for the lock indefinitely
+            if status in (5, 6):  # SQLITE_BUSY, SQLITE_LOCKED
+                raise sqlite3.OperationalError(u"database is locked")
+
+        source = sqlite3.connect(self.database_uri(u"mode=ro"), uri=True,
+                                 timeout=.1)
+        conn = sqlite3.connect(u":memory:")
+        try:
+            source.backup(conn, pages=1024, progress=progress)
+        finally:
+            source.close()
+        return conn
+
+    def connect_copy(self):
+
+        """
+		Returns:
+		A connection to a copy of the database in the home folder.
+		"""
+
+        shutil.copyfile(self.zotero_database, self.gnotero_database)
+        return sqlite3.connect(self.gnotero_database)
+
+    def update_full(self, cur, progress=None):
+
+        """
+		Builds a new index from scratch.
+
+		Arguments:
+		cur			--	A cursor for the database.
+
+		Keyword arguments:
+		progress	--	See update(). (default=None)
+
+		Returns:
+		A zotero_index.
+		"""
+
+        t = time.time()
+        index = zotero_index(self.noteProvider)
+        self.read_state(cur, index)
+        self.index_items(cur, index, u"", progress)
+        for item in index.items.values():
+            item.compact()
+        index.ngrams = ngram_index(index.items, self.ngram_fields)
+        if self.fts is not None:
+            self.fts.rebuild(index.items.values())
+        print(u"libzotero.update(): indexing completed in %.3fs"
+              % (time.time() - t))
+        print(u"%s entries processed" % len(index.items))
+        return index
+
+    def update_incremental(self, cur, current, progress=None):
+
+        """
+		Builds a new index from the current index, by re-indexing only the
+		items that were added, modified, trashed or removed since the current
+		index was built, and patching the collection and tag indexes
+		accordingly.
+
+		Arguments:
+		cur			--	A cursor for the database.
+		current		--	The current zotero_index.
+
+		Keyword arguments:
+		progress	--	See update(). (default=None)
+
+		Returns:
+		A zotero_index, or None if a full rebuild is needed.
+		"""
+
+        t = time.time()
+        index = current.copy()
+        self.read_state(cur, index)
+        # Renaming or removing a collection affects all its items without
+        # touching them, so this is left to a full rebuild
+        if index.collection_state != current.collection_state:
+            print(u"libzotero.update(): collections changed")
+            return None
+        changed = {item_id for item_id, state in index.item_state.items()
+                   if current.item_state.get(item_id) != state}
+        # Items that were moved to or restored from the trash, or retracted
+        changed |= index.excluded ^ current.excluded
+        removed = set(current.item_state) - set(index.item_state)
+        # A changed or removed attachment also changes its parent item
+        for item_id in changed | removed:
+            if item_id in index.attachment_parents:
+                changed.add(index.attachment_parents.pop(item_id))
+                index.attachment_keys.pop(item_id, None)
+        changed -= removed
+        if len(changed) > len(index.item_state) // 4:
+            print(u"libzotero.update(): %d items changed" % len(changed))
+            return None
+        cur.execute(u"create temp table if not exists changedItems "
+                    u"(itemID integer primary key)")
+        cur.execute(u"delete from temp.changedItems")
+        cur.executemany(u"insert into temp.changedItems values (?)",
+                        [(item_id,) for item_id in changed])
+        # New attachments are only known to the database
+        cur.execute(self.attachment_parent_query)
+        parents = {item[0] for item in cur.fetchall()} - changed
+        cur.executemany(u"insert into temp.changedItems values (?)",
+                        [(item_id,) for item_id in parents])
+        changed |= parents
+        for item_id in changed | removed:
+            index.remove_item(item_id)
+        self.index_items(cur, index, self.changed_clause, progress)
+        for item_id in changed:
+            if item_id in index.items:
+                index.items[item_id].compact()
+        # The changed items are kept apart from the bulk of the search index,
+        # until there are so many of them that it is rebuilt
+        if len(index.ngrams.changed | changed) > len(index.items) // 10:
+            index.ngrams = ngram_index(index.items, self.ngram_fields)
+        else:
+            for item_id in changed:
+                if item_id in index.items:
+                    index.ngrams.add(index.items[item_id])
+        # The full-text index only holds the current items if it was built
+        # along with them. Otherwise, such as when it was lost while the index
+        # was cached, applying the changes would not make it complete.
+        if self.fts is not None and self.fts.mtime() != current.mtime:
+            self.fts.rebuild(index.items.values())
+        elif self.fts is not None:
+            self.fts.update(changed | removed,
+                            [index.items[item_id] for item_id in changed
+                             if item_id in index.items])
+        print(u"libzotero.update(): re-indexed %d changed and %d removed "
+              u"items in %.3fs" % (len(changed), len(removed),
+                                   time.time() - t))
+        return index
+
+    def read_state(self, cur, index):
+
+        """
+		Reads the modification state of all items and collections, and the
+		items that should be ignored because they are deleted or retracted.
+
+		Arguments:
+		cur			--	A cursor for the database.
+		index		--	The zotero_index in which the state is stored.
+		"""
+
+        cur.execute(self.item_state_query)
+        index.item_state = {item[0]: item[1:] for item in cur.fetchall()}
+        cur.execute(self.collection_state_query)
+        index.collection_state = sorted(cur.fetchall())
+        cur.execute(self.deleted_query)
+        index.excluded = {item[0] for item in cur.fetchall()}
+        cur.execute(self.retracted_query)
+        index.excluded.update(item[0] for item in cur.fetchall())
+
+    def index_items(self, cur, index, restrict, progress=None):
+
+        """
+		Indexes items from the database.
+
+		Arguments:
+		cur			--	A cursor for the database.
+		index		--	The zotero_index in which the items are stored.
+		restrict	--	A clause to restrict the indexed items, or an empty
+						string to index all items.
+
+		Keyword arguments:
+		progress	--	See update(). (default=None)
+		"""
+
+        if progress is None:
+            progress = lambda percentage: None
+        # Map the ids of the indexed fields onto a function that stores the
+        # value in an item
+        cur.execute(self.fields_query)
+        setters = {}
+        for field_id, field_name in cur.fetchall():
+            if field_name in self.field_attributes:
+                setters[field_id] = self.field_setter(field_name)
+        # Retrieve information about date, publication, volume, issue, DOI,
+        # title, and abstract.
+        cur.execute(self.info_query % (
+            u", ".join(str(field_id) for field_id in setters), restrict))
+        for item_id, field_id, value, key in cur.fetchall():
+            entry = index.get_item(item_id)
+            entry.key = key
+            setters[field_id](entry, value)
+        progress(40)
+        # Retrieve author and editor information
+        for creator_type, attribute in ((u"author", u"authors"),
+                                        (u"editor", u"editors")):
+            cur.execute(self.creator_query % (creator_type, restrict))
+            for item_id, name in cur.fetchall():
+                getattr(index.get_item(item_id), attribute).append(name.title())
+        progress(60)
+        # Retrieve collection information
+        cur.execute(self.collection_query % restrict)
+        for item_id, item_collection in cur.fetchall():
+            index.get_item(item_id).collections.append(item_collection)
+            index.collection_index[item_collection] = \
+                index.collection_index.get(item_collection, 0) + 1
+        progress(70)
+        # Retrieve tag information
+        cur.execute(self.tag_query % restrict)
+        for item_id, item_tag in cur.fetchall():
+            # Only add tags for existing entries in the index
+            if item_id in index.items:
+                index.items[item_id].tags.append(item_tag)
+                index.tag_index[item_tag] = \
+                    index.tag_index.get(item_tag, 0) + 1
+        progress(80)
+        # Retrieve attachments
+        cur.execute(self.attachment_query % restrict)
+        for item_id, att, attachment_id, key in cur.fetchall():
+            index.attachment_parents[attachment_id] = item_id
+            index.attachment_keys[attachment_id] = key
+            if att is None:
+                continue
+            # If the attachment is stored in the Zotero folder, it is preceded
+            # by "storage:"
+            if att[:8] == u"storage:":
+                item_attachment = att[8:]
+                if item_attachment[-4:].lower() in self.attachment_ext:
+                    index.get_item(item_id).fulltext.append(os.path.join(
+                        self.storage_path, key, item_attachment))
+            # If the attachment is linked, it is simply the full
+            # path to the attachment
+            else:
+                index.get_item(item_id).fulltext.append(att)
+        progress(90)
+
+    def field_setter(self, field_name):
+
+        """
+		Arguments:
+		field_name	--	The name of an indexed field.
+
+		Returns:
+		A function that stores a value of the field in a zotero_item.
+		"""
+
+        attribute = self.field_attributes[field_name]
+        if field_name == u"date":
+            # We only want a year representation of dates
+            return lambda item, value: setattr(item, attribute, value[0:4])
+        if attribute in (u"title", u"publication"):
+            return lambda item, value: setattr(item, attribute, str(value))
+        return lambda item, value: setattr(item, attribute, value)
+
     def search(self, query):
 
         """
@@ -405,22 +1053,279 @@ class LibZotero(object):
 		A list of zotero_items.
 		"""
 
-        if not self.update():
-            return []
-        if query in self.search_cache:
-            print(u"libzotero.search(): retrieving results for '%s' from cache"
-                  % query)
-            return self.search_cache[query]
+        return list(self.search_results(query))
+
+    def search_results(self, query, max_results=None):
+
+        """
+		Searches the zotero database, without looking up the matching items
+		until they are needed.
+
+		Argument:
+		query		--	A search query.
+
+		Keyword arguments:
+		max_results	--	The maximum number of ranked results, 0 for no
+						limit, or None for the maxResults setting.
+						(default=None)
+
+		Returns:
+		A searchResults object, from which the zotero_items can be fetched
+		in order.
+		"""
+
+        if self.autoUpdate and not self.update():
+            return search_results(None, (), query)
+        # Stick to the current index, even if it is replaced during the search
+        index = self.zotero_index
+        search_cache = index.caches().search_cache
+        rank_results = getConfig(u"rankResults")
+        if max_results is None:
+            max_results = getConfig(u"maxResults")
         t = time.time()
         terms = parse_query(query)
-        if len(terms) == 0:
-            return []
-        results = []
-        for item_id, item in self.index.items():
-            if item.match(terms):
-                results.append(item)
-        self.search_cache[query] = results
+        ranked = None
+        ids = search_cache.get(query)
+        if ids is not None:
+            print(u"libzotero.search(): retrieving results for '%s' from cache"
+                  u" (%s)" % (query, search_cache.stats()))
+            if rank_results:
+                ranked = search_cache.get_ranked(query, max_results)
+        else:
+            if len(terms) == 0:
+                return search_results(index, (), query)
+            self.searches += 1
+            ids = self.refine(index, terms)
+            if ids is None:
+                ids = self.search_index(index, terms)
+            # The cache holds all matches, so that they can be refined
+            search_cache.put(query, terms, ids)
+        if rank_results and ranked is None:
+            ranked = self.rank(index, ids, terms, max_results)
+            search_cache.put_ranked(query, max_results, ranked)
         print(u"libzotero.search(): search for '%s' completed in %.3fs" %
               (query, time.time() - t))
+        if rank_results:
+            return search_results(index, ranked, query, matches=len(ids))
+        return search_results(index, ids, query)
+
+    def rank(self, index, ids, terms, max_results):
+
+        """
+		Orders search results by relevance, and keeps only the best ones if
+		the number of results is limited.
+
+		Arguments:
+		index		--	The zotero_index that was searched.
+		ids			--	The ids of the matching items.
+		terms		--	The parsed query, as returned by parse_query().
+		max_results	--	The maximum number of results, or 0 for no limit.
+
+		Returns:
+		A list of item ids.
+		"""
+
+        frequencies = []
+        for term in terms:
+            # The number of items that match a term determines how much it
+            # counts. This is estimated from the postings of the n-gram
+            # index, rather than searched for. All results match every term,
+            # and attachments and abstracts are not in the n-gram index.
+            if term not in index.document_frequencies:
+                index.document_frequencies[term] = \
+                    index.ngrams.document_frequency(*term)
+            frequencies.append(min(len(index.items), max(
+                len(ids), index.document_frequencies[term])))
+        return ranking.rank(index, ids, terms, frequencies, max_results)
+
+    def search_index(self, index, terms):
+
+        """
+		Searches the index.
+
+		Arguments:
+		index		--	The zotero_index to search.
+		terms		--	The parsed query, as returned by parse_query().
+
+		Returns:
+		A sorted list of item ids.
+		"""
+
+        # Terms that search the contents of attachments are looked up first,
+        # all at once
+        fulltext = self.search_fulltext(
+            index, [term for term_type, term in terms
+                    if term_type == u"fulltext"])
+        # Every term narrows down the set of matching items
+        matches = None
+        for term_type, term in terms:
+            if term_type == u"fulltext":
+                term_matches = fulltext[term].copy()
+            else:
+                term_matches = index.ngrams.search(term_type, term)
+            if self.fts is not None:
+                fts_matches = self.fts.search(term_type, term, index.mtime)
+                if fts_matches is None:
+                    fts_matches = self.fts.scan(index.items.values(),
+                                                term_type, term)
+                term_matches |= fts_matches
+            if matches is None:
+                matches = term_matches
+            else:
+                matches &= term_matches
+            if not matches:
+                break
+        # The contents of attachments are looked up in the database, which
+        # may have changed since the index was built
+        return sorted(item_id for item_id in matches if item_id in index.items)
+
+    def search_fulltext(self, index, words):
+
+        """
+		Searches the contents of attachments, through the words that Zotero
+		has indexed. All words are looked up in a single query, and the items
+		that contain each word are cached.
+
+		Arguments:
+		index		--	The zotero_index to search.
+		words		--	A list of words.
+
+		Returns:
+		A dict that maps every word onto the set of ids of the items with an
+		attachment that contains a word starting with it.
+		"""
+
+        results = {}
+        missing = []
+        fulltext_cache = index.caches().fulltext_cache
+        for word in words:
+            ids = fulltext_cache.get(word)
+            if ids is None:
+                if word not in missing:
+                    missing.append(word)
+            else:
+                results[word] = set(ids)
+        if not missing:
+            return results
+        t = time.time()
+        query = u" union all ".join(self.fulltext_query % i
+                                    for i in range(len(missing)))
+        args = []
+        for word in missing:
+            args += [word, word + u"\uffff"]
+        found = [set() for word in missing]
+        rows = []
+        try:
+            conn = self.fulltext_connection(index)
+            rows += conn.execute(query, args).fetchall()
+            if self.ftcache is not None:
+                rows += self.ftcache.search(missing)
+        except Exception as e:
+            print(u"libzotero.search_fulltext(): %s" % e)
+        for i, attachment_id in rows:
+            # Attachments are matched through their parent item
+            item_id = index.attachment_parents.get(attachment_id)
+            if item_id is not None:
+                found[i].add(item_id)
+        for word, ids in zip(missing, found):
+            fulltext_cache.put(word, (), sorted(ids))
+            results[word] = ids
+        print(u"libzotero.search_fulltext(): looked up %d words in %.3fs"
+              % (len(missing), time.time() - t))
         return results
 
+    def update_ftcache(self, should_stop=None):
+
+        """
+		Indexes the text of the attachments that Zotero caches in the storage
+		folder, if this is enabled. This is slow, and is done separately from
+		updating the index.
+
+		Keyword arguments:
+		should_stop	--	A function that returns True when indexing should be
+						interrupted. (default=None)
+		"""
+
+        if self.ftcache is None:
+            return
+        index = self.zotero_index
+        if self.ftcache.update(self.storage_path, index.attachment_keys,
+                               should_stop):
+            # Earlier results of fulltext: searches may be incomplete, so
+            # the index is published again without them. The index may have
+            # been replaced by an update in the meantime.
+            with self.update_lock:
+                self.publish(self.zotero_index.without_caches())
+
+    def fulltext_connection(self, index):
+
+        """
+		Arguments:
+		index		--	The zotero_index that is searched.
+
+		Returns:
+		A read-only connection to the live database for the current thread,
+		which is re-opened when the database has changed since it was opened.
+		The database is never copied for a search, so if it cannot be read
+		in readonly mode, it is read in immutable mode.
+
+		Raises:
+		sqlite3.Error if the database cannot be read.
+		"""
+
+        local = self.fulltext_local
+        if getattr(local, u"conn", None) is not None:
+            if local.mtime == index.mtime:
+                return local.conn
+            local.conn.close()
+            local.conn = None
+        try:
+            conn = self.connect_mode(u"readonly")
+        except sqlite3.Error as e:
+            print(u"libzotero.fulltext_connection(): cannot open database in "
+                  u"readonly mode: %s" % e)
+            conn = self.connect_mode(u"immutable")
+        local.conn = conn
+        local.mtime = index.mtime
+        return local.conn
+
+    def refine(self, index, terms):
+
+        """
+		Searches the results of a previous search, if the query refines the
+		query of that search. While typing, every query refines the previous
+		one, so the results only need to be narrowed down.
+
+		Arguments:
+		index		--	The zotero_index to search.
+		terms		--	The parsed query, as returned by parse_query().
+
+		Returns:
+		A sorted list of item ids, or None if the query doesn't refine any
+		previous query.
+		"""
+
+        base = None
+        for base_query, base_terms, base_ids in \
+                index.caches().search_cache.items():
+            if base is not None and len(base_ids) >= len(base[1]):
+                continue
+            if refines(terms, base_terms):
+                base = base_terms, base_ids
+        if base is None:
+            return None
+        base_terms, base_ids = base
+        # The terms of the previous query have already been matched
+        new_terms = [term for term in terms if term not in base_terms]
+        # The contents of attachments are not part of the items
+        for term_type, term in new_terms:
+            if term_type == u"fulltext":
+                return None
+        self.refined_searches += 1
+        print(u"libzotero.search(): refining %d results (%d of %d searches "
+              u"refined)" % (len(base_ids), self.refined_searches,
+                              self.searches))
+        if not new_terms:
+            return list(base_ids)
+        return [item_id for item_id in base_ids
+                if index.items[item_id].match(new_terms)]
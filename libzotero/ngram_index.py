@@ -0,0 +1,293 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+
+from array import array
+from libzotero.zotero_item import search_fields
+
+
+class ngramIndex(object):
+
+    """
+    An inverted index that finds the items that match a search term without
+    looking at every item.
+
+    Search terms never contain whitespace, so a term occurs in a value if and
+    only if it occurs in one of the whitespace-separated words of that value.
+    The index therefore maps each word onto the items that contain it, per
+    field, and maps the n-grams of the words onto the words. A term is
+    resolved by intersecting the word lists of its n-grams, checking the
+    resulting words, and joining their items.
+
+    The bulk of the index is built once, in compact arrays, and shared
+    between copies. Items that are re-indexed afterwards go into a small
+    overlay, and their entries in the shared arrays are ignored.
+    """
+
+    n = 3
+
+    def __init__(self, items=None, fields=None):
+
+        """
+        Constructor.
+
+        Keyword arguments:
+        items	--	A dict of zoteroItems by id to build the index from.
+                    (default=None)
+        fields	--	The fields to index, or None to index all searchable
+                    fields. (default=None)
+        """
+
+        if fields is None:
+            fields = search_fields
+        self.fields = tuple(fields)
+        # All words, sorted
+        self.words = []
+        # For every n-gram, the positions of the words that contain it, as
+        # (start, end) slices of gram_words
+        self.grams = {}
+        self.gram_words = array(u"i")
+        # For every field, the offsets of the items of each word in the ids
+        # array
+        self.postings = {}
+        # Items that have been re-indexed since the index was built, and
+        # their words, by field
+        self.changed = set()
+        self.overlay = {field: {} for field in self.fields}
+        if items is not None:
+            self.build(items)
+
+    def build(self, items):
+
+        """
+        Builds the index.
+
+        Arguments:
+        items	--	A dict of zoteroItems by id.
+        """
+
+        item_words = {field: {} for field in self.fields}
+        for item_id, item in items.items():
+            for field, value in item.search_values():
+                field_words = item_words.get(field)
+                if field_words is None:
+                    continue
+                for word in set(value.split()):
+                    ids = field_words.get(word)
+                    if ids is None:
+                        field_words[word] = [item_id]
+                    # A word can occur in several values of the same field
+                    elif ids[-1] != item_id:
+                        ids.append(item_id)
+        self.words = sorted(set().union(*item_words.values()))
+        for field, field_words in item_words.items():
+            starts = array(u"i", [0])
+            ids = array(u"i")
+            for word in self.words:
+                ids.extend(field_words.get(word, ()))
+                starts.append(len(ids))
+            self.postings[field] = starts, ids
+        grams = {}
+        for pos, word in enumerate(self.words):
+            for gram in self.word_grams(word):
+                if gram in grams:
+                    grams[gram].append(pos)
+                else:
+                    grams[gram] = [pos]
+        self.gram_words = array(u"i")
+        for gram, positions in grams.items():
+            start = len(self.gram_words)
+            self.gram_words.extend(positions)
+            self.grams[gram] = start, len(self.gram_words)
+        self.changed = set()
+        self.overlay = {field: {} for field in self.fields}
+
+    def copy(self):
+
+        """
+        Returns:
+        A copy of the index that can be modified without affecting this
+        index.
+        """
+
+        index = ngramIndex(fields=self.fields)
+        index.words = self.words
+        index.grams = self.grams
+        index.gram_words = self.gram_words
+        index.postings = self.postings
+        index.changed = self.changed.copy()
+        index.overlay = {field: {word: ids.copy()
+                                 for word, ids in field_words.items()}
+                         for field, field_words in self.overlay.items()}
+        return index
+
+    def add(self, item):
+
+        """
+        Adds a re-indexed item to the overlay.
+
+        Arguments:
+        item	--	A zoteroItem.
+        """
+
+        self.changed.add(item.id)
+        for field, words in self.item_words(item).items():
+            field_words = self.overlay[field]
+            for word in words:
+                if word in field_words:
+                    field_words[word].add(item.id)
+                else:
+                    field_words[word] = {item.id}
+
+    def remove(self, item):
+
+        """
+        Removes an item from the index.
+
+        Arguments:
+        item	--	A zoteroItem.
+        """
+
+        self.changed.add(item.id)
+        for field, words in self.item_words(item).items():
+            field_words = self.overlay[field]
+            for word in words:
+                if word in field_words:
+                    field_words[word].discard(item.id)
+                    if not field_words[word]:
+                        del field_words[word]
+
+    def item_words(self, item):
+
+        """
+        Arguments:
+        item	--	A zoteroItem.
+
+        Returns:
+        A dict with the set of words of the item for every field.
+        """
+
+        words = {}
+        for field, value in item.search_values():
+            if field not in self.overlay:
+                continue
+            if field in words:
+                words[field].update(value.split())
+            else:
+                words[field] = set(value.split())
+        return words
+
+    def word_grams(self, word):
+
+        """
+        Arguments:
+        word	--	A word or a search term.
+
+        Returns:
+        The set of n-grams of the word.
+        """
+
+        return {word[i:i + self.n] for i in range(len(word) - self.n + 1)}
+
+    def matching_words(self, term):
+
+        """
+        Arguments:
+        term	--	A search term.
+
+        Returns:
+        The positions of the words that contain the term.
+        """
+
+        if len(term) < self.n:
+            return [pos for pos, word in enumerate(self.words) if term in word]
+        slices = []
+        for gram in self.word_grams(term):
+            if gram not in self.grams:
+                return []
+            slices.append(self.grams[gram])
+        slices.sort(key=lambda s: s[1] - s[0])
+        start, end = slices[0]
+        positions = set(self.gram_words[start:end])
+        for start, end in slices[1:]:
+            positions.intersection_update(self.gram_words[start:end])
+            if not positions:
+                return []
+        return [pos for pos in positions if term in self.words[pos]]
+
+    def search(self, term_type, term):
+
+        """
+        Finds the items that match a search term, with exactly the same
+        semantics as zoteroItem.match().
+
+        Arguments:
+        term_type	--	The type of the term, or None to search all fields.
+        term		--	The search term.
+
+        Returns:
+        A set of item ids.
+        """
+
+        fields = [field for field in self.fields
+                  if term_type in search_fields[field]]
+        positions = self.matching_words(term)
+        results = set()
+        for field in fields:
+            starts, ids = self.postings.get(field, (None, None))
+            if starts is None:
+                continue
+            for pos in positions:
+                results.update(ids[starts[pos]:starts[pos + 1]])
+        results -= self.changed
+        for field in fields:
+            for word, item_ids in self.overlay[field].items():
+                if term in word:
+                    results |= item_ids
+        return results
+
+    def document_frequency(self, term_type, term):
+
+        """
+        Estimates the number of items that match a search term, from the
+        lengths of the postings of the matching words, without collecting
+        the items. An item that contains several matching words, or that was
+        re-indexed, is counted more than once.
+
+        Arguments:
+        term_type	--	The type of the term, or None to search all fields.
+        term		--	The search term.
+
+        Returns:
+        The estimated number of items.
+        """
+
+        fields = [field for field in self.fields
+                  if term_type in search_fields[field]]
+        positions = self.matching_words(term)
+        count = 0
+        for field in fields:
+            starts, ids = self.postings.get(field, (None, None))
+            if starts is not None:
+                for pos in positions:
+                    count += starts[pos + 1] - starts[pos]
+            for word, item_ids in self.overlay[field].items():
+                if term in word:
+                    count += len(item_ids)
+        return count
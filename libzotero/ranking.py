@@ -0,0 +1,257 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+
+import heapq
+import math
+import time
+from libzotero.zotero_item import term_fields
+
+# How much a match in each field counts
+field_weights = {
+    u"title": 3.0,
+    u"author": 2.5,
+    u"editor": 1.5,
+    u"tag": 1.5,
+    u"collection": 1.0,
+    u"publication": 1.0,
+    u"doi": 1.0,
+    u"date": 1.0,
+    u"abstract": 0.5,
+}
+
+# BM25 parameters: k1 limits the effect of repeated matches, and b the
+# normalization for the length of a field
+k1 = 1.2
+b = 0.75
+
+# Recent items get a boost of up to recency_boost, which halves every
+# recency_half_life years
+recency_boost = 0.3
+recency_half_life = 10.
+
+
+def average_lengths(index):
+
+    """
+    Computes the average length of the values of each field. The result is
+    stored in the index.
+
+    Arguments:
+    index	--	A zoteroIndex.
+
+    Returns:
+    A dict that maps fields onto average lengths.
+    """
+
+    if index.average_lengths is None:
+        totals = dict.fromkeys(field_weights, 0)
+        counts = dict.fromkeys(field_weights, 0)
+        for item in index.items.values():
+            for field, key in item.search_values():
+                totals[field] += len(key)
+                counts[field] += 1
+        index.average_lengths = {field: max(1., totals[field] / counts[field])
+                                 for field in totals if counts[field]}
+    return index.average_lengths
+
+
+def recency(item, this_year):
+
+    """
+    Arguments:
+    item		--	A zoteroItem.
+    this_year	--	The current year.
+
+    Returns:
+    The factor by which the score of the item is boosted for being recent.
+    """
+
+    # Recent items are usually the ones that are looked for
+    if item.date is not None and item.date.isdigit():
+        age = max(0, this_year - int(item.date))
+        return 1 + recency_boost * .5 ** (age / recency_half_life)
+    return 1.
+
+
+def score_bounds(index, this_year):
+
+    """
+    Computes, for every item, the recency boost and the sum over all values
+    of the weighted and normalized value length. A term of length n occurs
+    at most len(value) / n times in a value, so the weighted frequency of
+    the term in the item is at most this sum divided by n. The result is
+    stored in the index.
+
+    Arguments:
+    index		--	A zoteroIndex.
+    this_year	--	The current year.
+
+    Returns:
+    A (bounds, order) tuple, where bounds is a dict that maps item ids onto
+    (length sum, recency boost) tuples, and order is a list of all item ids,
+    with the largest recency boost first.
+    """
+
+    if index.score_bounds is None or index.score_bounds[0] != this_year:
+        lengths = average_lengths(index)
+        bounds = {}
+        for item_id, item in index.items.items():
+            total = 0.
+            for field, key in item.search_values():
+                if field in lengths:
+                    total += field_weights[field] * len(key) / (
+                        1 - b + b * len(key) / lengths[field])
+            bounds[item_id] = total, recency(item, this_year)
+        order = sorted(bounds, key=lambda item_id: (-bounds[item_id][1],
+                                                    item_id))
+        index.score_bounds = this_year, bounds, order
+    return index.score_bounds[1:]
+
+
+def idf(item_count, document_frequency):
+
+    """
+    Arguments:
+    item_count			--	The number of items in the index.
+    document_frequency	--	The number of items that match a term.
+
+    Returns:
+    The inverse document frequency of the term.
+    """
+
+    return math.log(1 + (item_count - document_frequency + .5) /
+                    (document_frequency + .5))
+
+
+def score(item, terms, lengths, boost):
+
+    """
+    Scores an item that matches a query, with BM25F: the occurrences of each
+    term are weighted by field and normalized for the length of the value
+    they occur in, before they are saturated and weighted by the rarity of
+    the term.
+
+    Arguments:
+    item		--	A zoteroItem.
+    terms		--	A list of (fields, term, idf) tuples, where fields maps
+                    the fields that a term searches onto their weights, or
+                    is None for terms that don't search the fields of items.
+    lengths		--	See average_lengths().
+    boost		--	The recency boost of the item, as returned by recency().
+
+    Returns:
+    The score.
+    """
+
+    values = item.search_values()
+    total = 0.
+    for fields, term, term_idf in terms:
+        if fields is None:
+            frequency = 1.
+        else:
+            frequency = 0.
+            # Most values don't contain the term, and are skipped quickly
+            for field, key in [value for value in values if term in value[1]]:
+                if field in fields:
+                    frequency += fields[field] * key.count(term) / (
+                        1 - b + b * len(key) / lengths[field])
+        total += term_idf * frequency / (k1 + frequency)
+    return total * boost
+
+
+def rank(index, item_ids, terms, document_frequencies, max_results=0):
+
+    """
+    Orders search results by relevance.
+
+    Arguments:
+    index					--	The zoteroIndex that was searched.
+    item_ids				--	The ids of the matching items.
+    terms					--	The parsed query.
+    document_frequencies	--	A list with the number of items that match
+                                each term.
+
+    Keyword arguments:
+    max_results				--	The maximum number of results, or 0 for no
+                                limit. (default=0)
+
+    Returns:
+    A list of item ids, most relevant first.
+    """
+
+    item_count = max(1, len(index.items))
+    weighted_terms = []
+    for (term_type, term), frequency in zip(terms, document_frequencies):
+        # Terms such as fulltext: terms are not matched against fields
+        if term_type in term_fields:
+            fields = {field: field_weights[field]
+                      for field in term_fields[term_type]}
+        else:
+            fields = None
+        weighted_terms.append((fields, term, idf(item_count, frequency)))
+    lengths = average_lengths(index)
+    this_year = time.localtime().tm_year
+    items = index.items
+    if not max_results or max_results >= len(item_ids):
+        scores = {item_id: score(items[item_id], weighted_terms, lengths,
+                                 recency(items[item_id], this_year))
+                  for item_id in item_ids}
+        return sorted(item_ids, key=scores.__getitem__, reverse=True)
+    # Items are scored in the order of their recency boost. An item can only
+    # make it into the best results if its upper bound exceeds the score of
+    # the worst of the best results so far. Once that is impossible even for
+    # a term that occurs in every value, no other item can make it.
+    bounds, order = score_bounds(index, this_year)
+    fixed = 0.
+    term_lengths = []
+    for fields, term, term_idf in weighted_terms:
+        if fields is None:
+            fixed += term_idf / (k1 + 1)
+        else:
+            term_lengths.append((term_idf, len(term)))
+    limit = fixed + sum(term_idf for term_idf, length in term_lengths)
+    if len(item_ids) * 4 < len(order):
+        candidates = sorted(item_ids, key=lambda item_id: -bounds[item_id][1])
+    else:
+        matches = set(item_ids)
+        candidates = (item_id for item_id in order if item_id in matches)
+    # The worst result is at the top of the heap. Of items with the same
+    # score, the one with the lowest id comes first.
+    best = []
+    for item_id in candidates:
+        total, boost = bounds[item_id]
+        if len(best) == max_results:
+            # Leave room for rounding errors
+            worst = best[0][0] / (boost * 1.000001)
+            if limit < worst:
+                break
+            bound = fixed
+            for term_idf, length in term_lengths:
+                frequency = total / length
+                bound += term_idf * frequency / (k1 + frequency)
+            if bound < worst:
+                continue
+        result = score(items[item_id], weighted_terms, lengths,
+                       boost), -item_id
+        if len(best) < max_results:
+            heapq.heappush(best, result)
+        elif result > best[0]:
+            heapq.heapreplace(best, result)
+    return [-item_id for item_score, item_id in sorted(best, reverse=True)]
@@ -0,0 +1,180 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+
+import sys
+from array import array
+from collections import OrderedDict
+
+
+class searchCache(object):
+
+    """
+    Remembers the results of recent searches, as arrays of item ids. The
+    least recently used results are discarded once the cache holds too many
+    results, or takes up too much memory.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=8388608):
+
+        """
+        Constructor.
+
+        Keyword arguments:
+        max_entries	--	The maximum number of cached searches, or 0 for no
+                        limit. (default=256)
+        max_bytes	--	The approximate maximum size of the cache in bytes,
+                        or 0 for no limit. (default=8388608)
+        """
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # Queries map onto (terms, ids, size, ranked) tuples, where ranked is
+        # None, or a (max_results, ids) tuple with the best results in order
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+
+        return len(self.entries)
+
+    def __contains__(self, query):
+
+        return query in self.entries
+
+    def get(self, query):
+
+        """
+        Retrieves the results of a search, and marks them as recently used.
+
+        Arguments:
+        query	--	A search query.
+
+        Returns:
+        An array of item ids, or None if the query is not cached.
+        """
+
+        entry = self.entries.get(query)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(query)
+        return entry[1]
+
+    def get_ranked(self, query, max_results):
+
+        """
+        Retrieves the ranked results of a search, without counting a hit.
+
+        Arguments:
+        query		--	A search query.
+        max_results	--	The maximum number of results that were ranked.
+
+        Returns:
+        An array of item ids, most relevant first, or None if the ranked
+        results are not cached.
+        """
+
+        entry = self.entries.get(query)
+        if entry is None or entry[3] is None or entry[3][0] != max_results:
+            return None
+        return entry[3][1]
+
+    def put(self, query, terms, ids):
+
+        """
+        Stores the results of a search, and discards the least recently used
+        results if the cache has grown too large.
+
+        Arguments:
+        query	--	A search query.
+        terms	--	The parsed query.
+        ids		--	An iterable of item ids.
+        """
+
+        ids = array(u"i", ids)
+        size = sys.getsizeof(query) + sys.getsizeof(ids) + \
+            sum(sys.getsizeof(term) for term_type, term in terms)
+        if query in self.entries:
+            self.size -= self.entries.pop(query)[2]
+        self.entries[query] = terms, ids, size, None
+        self.size += size
+        self.evict()
+
+    def put_ranked(self, query, max_results, ids):
+
+        """
+        Stores the ranked results of a search, along with its results.
+
+        Arguments:
+        query		--	A search query that is cached.
+        max_results	--	The maximum number of results that were ranked.
+        ids			--	An iterable of item ids, most relevant first.
+        """
+
+        entry = self.entries.get(query)
+        if entry is None:
+            return
+        terms, all_ids, size, ranked = entry
+        ids = array(u"i", ids)
+        new_size = size + sys.getsizeof(ids)
+        if ranked is not None:
+            new_size -= sys.getsizeof(ranked[1])
+        self.size += new_size - size
+        self.entries[query] = terms, all_ids, new_size, (max_results, ids)
+        self.evict()
+
+    def evict(self):
+
+        """
+        Discards the least recently used results while the cache is too
+        large.
+        """
+
+        while len(self.entries) > 1 and (
+                (self.max_entries and len(self.entries) > self.max_entries) or
+                (self.max_bytes and self.size > self.max_bytes)):
+            self.size -= self.entries.popitem(last=False)[1][2]
+            self.evictions += 1
+
+    def items(self):
+
+        """
+        Returns:
+        A list of (query, terms, ids) tuples for all cached searches, without
+        marking them as used.
+        """
+
+        return [(query, terms, ids) for query, (terms, ids, size, ranked)
+                in self.entries.items()]
+
+    def stats(self):
+
+        """
+        Returns:
+        A description of the cache size and hit rate, for logging.
+        """
+
+        return u"%d searches, %d bytes, %d hits, %d misses, %d evictions" % (
+            len(self.entries), self.size, self.hits, self.misses,
+            self.evictions)
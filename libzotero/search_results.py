@@ -0,0 +1,102 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+
+
+class searchResults(object):
+
+    """
+    The results of a search, as a cursor over the ids of the matching items.
+    Items are only looked up when they are fetched, so the cost of
+    presenting results depends on how many are shown rather than on how many
+    match. The results refer to the index that was searched, and are not
+    affected if the index is replaced later.
+    """
+
+    def __init__(self, index, ids, query=None, matches=None):
+
+        """
+        Constructor.
+
+        Arguments:
+        index	--	The zoteroIndex that was searched.
+        ids		--	A sequence of item ids, in the order of the results.
+
+        Keyword arguments:
+        query	--	The search query. (default=None)
+        matches	--	The number of items that match, which is larger than the
+                    number of results if only the best matches are kept, or
+                    None if all matches are results. (default=None)
+        """
+
+        self.index = index
+        self.ids = ids
+        self.query = query
+        self.matches = len(ids) if matches is None else matches
+        self.position = 0
+
+    def __len__(self):
+
+        return len(self.ids)
+
+    def __getitem__(self, i):
+
+        if isinstance(i, slice):
+            return [self.index.items[item_id] for item_id in self.ids[i]]
+        return self.index.items[self.ids[i]]
+
+    def __iter__(self):
+
+        for item_id in self.ids:
+            yield self.index.items[item_id]
+
+    def truncated(self):
+
+        """
+        Returns:
+        True if only the best matches are results, False otherwise.
+        """
+
+        return self.matches > len(self.ids)
+
+    def can_fetch_more(self):
+
+        """
+        Returns:
+        True if not all results have been fetched, False otherwise.
+        """
+
+        return self.position < len(self.ids)
+
+    def fetch(self, count):
+
+        """
+        Fetches the next results.
+
+        Arguments:
+        count	--	The maximum number of results to fetch.
+
+        Returns:
+        A list of zoteroItems, which is empty once all results have been
+        fetched.
+        """
+
+        items = self[self.position:self.position + count]
+        self.position += len(items)
+        return items
@@ -0,0 +1,284 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+
+import sys
+import threading
+from libqnotero.config import getConfig
+from libzotero.ngram_index import ngramIndex
+from libzotero.search_cache import searchCache
+from libzotero.zotero_item import zoteroItem
+
+
+class zoteroIndex(object):
+
+    """
+    The indexed items of a Zotero database, together with the state of the
+    database from which they were indexed. A new index is built off to the
+    side whenever the database changes, and then replaces the current one.
+
+    Once an index is published, it is an immutable snapshot: the items, the
+    collection, tag and search indexes and the state are never modified
+    again, so that searches in any thread can use it without locking. Only
+    the caches change. Every thread has its own caches of search results,
+    and the ranking statistics are derived from the snapshot, so that it
+    doesn't matter which thread computes them.
+    """
+
+    def __init__(self, noteProvider=None):
+
+        """
+        Constructor.
+
+        Keyword arguments:
+        noteProvider	--	A noteProvider object. (default=None)
+        """
+
+        self.noteProvider = noteProvider
+        self.items = {}
+        # Collections and tags map onto the number of items that use them
+        self.collection_index = {}
+        self.tag_index = {}
+        # The state of the database, which is used to find the items that
+        # need to be re-indexed
+        self.mtime = None
+        # Whether mtime includes the write-ahead log, which is only the case
+        # if the database was read in a mode that sees it
+        self.wal = True
+        self.size = None
+        self.item_state = {}
+        self.collection_state = None
+        self.excluded = set()
+        self.attachment_parents = {}
+        # The keys of attachments, which are also the names of their folders
+        # in the storage folder
+        self.attachment_keys = {}
+        # The inverted index that is used for searching
+        self.ngrams = ngramIndex()
+        # Set once the index replaces the current index
+        self.published = False
+        # Remember search results so results speed up over time, per thread
+        self.local = threading.local()
+        # Statistics for ranking search results, which are collected when
+        # they are first needed
+        self.average_lengths = None
+        self.score_bounds = None
+        self.document_frequencies = {}
+
+    def __getstate__(self):
+
+        """
+        Returns:
+        The state of the index for pickling, without the noteProvider, the
+        search results and the ranking statistics.
+        """
+
+        state = self.__dict__.copy()
+        del state[u"noteProvider"]
+        del state[u"published"]
+        del state[u"local"]
+        del state[u"average_lengths"]
+        del state[u"score_bounds"]
+        del state[u"document_frequencies"]
+        return state
+
+    def __setstate__(self, state):
+
+        """
+        Restores a pickled index.
+
+        Arguments:
+        state	--	The state as returned by __getstate__().
+        """
+
+        self.__dict__.update(state)
+        self.noteProvider = None
+        self.published = False
+        self.local = threading.local()
+        self.average_lengths = None
+        self.score_bounds = None
+        self.document_frequencies = {}
+
+    def caches(self):
+
+        """
+        Returns:
+        The caches of the current thread, as an object with a search_cache
+        for the results of searches and a fulltext_cache for the items that
+        contain words in their attachments.
+        """
+
+        local = self.local
+        if getattr(local, u"search_cache", None) is None:
+            local.search_cache = self.new_search_cache()
+            local.fulltext_cache = self.new_search_cache()
+        return local
+
+    def new_search_cache(self):
+
+        """
+        Returns:
+        An empty searchCache, with the size limits from the configuration.
+        """
+
+        return searchCache(getConfig(u"searchCacheMaxEntries"),
+                           getConfig(u"searchCacheMaxBytes"))
+
+    def set_note_provider(self, noteProvider):
+
+        """
+        Sets the noteProvider of the index and of all its items.
+
+        Arguments:
+        noteProvider	--	A noteProvider object.
+        """
+
+        self.check_unpublished()
+        self.noteProvider = noteProvider
+        for item in self.items.values():
+            item.noteProvider = noteProvider
+
+    def publish(self):
+
+        """
+        Marks the index as an immutable snapshot, before it replaces the
+        current index.
+        """
+
+        self.published = True
+
+    def check_unpublished(self):
+
+        """
+        Raises:
+        RuntimeError if the index has been published, and may therefore be
+        in use by searches.
+        """
+
+        if self.published:
+            raise RuntimeError(u"a published index cannot be modified")
+
+    def without_caches(self):
+
+        """
+        Returns:
+        A snapshot that shares all indexed data with this index, but starts
+        with empty caches and document frequencies. This is published when
+        the searches of the current index may have become stale, because the
+        attachment index changed.
+        """
+
+        index = zoteroIndex.__new__(zoteroIndex)
+        index.__dict__.update(self.__dict__)
+        index.local = threading.local()
+        index.document_frequencies = {}
+        return index
+
+    def copy(self):
+
+        """
+        Returns:
+        A copy of the index that can be patched without affecting this index.
+        The items themselves are shared, so an item that changes needs to be
+        removed and indexed again, rather than modified.
+        """
+
+        index = zoteroIndex(self.noteProvider)
+        index.items = self.items.copy()
+        index.collection_index = self.collection_index.copy()
+        index.tag_index = self.tag_index.copy()
+        index.mtime = self.mtime
+        index.wal = self.wal
+        index.size = self.size
+        index.item_state = self.item_state
+        index.collection_state = self.collection_state
+        index.excluded = self.excluded
+        index.attachment_parents = self.attachment_parents.copy()
+        index.attachment_keys = self.attachment_keys.copy()
+        index.ngrams = self.ngrams.copy()
+        return index
+
+    def memory_usage(self):
+
+        """
+        Estimates the memory that is taken up by the indexed items and the
+        search index, counting shared objects once.
+
+        Returns:
+        The size in bytes.
+        """
+
+        seen = set()
+        size = 0
+        stack = [self.items, self.ngrams.__dict__]
+        while stack:
+            obj = stack.pop()
+            if id(obj) in seen or obj is self.noteProvider:
+                continue
+            seen.add(id(obj))
+            size += sys.getsizeof(obj)
+            if isinstance(obj, dict):
+                stack.extend(obj.keys())
+                stack.extend(obj.values())
+            elif isinstance(obj, (list, tuple, set, frozenset)):
+                stack.extend(obj)
+            elif isinstance(obj, zoteroItem):
+                stack.extend(getattr(obj, attribute)
+                             for attribute in obj.__slots__)
+        return size
+
+    def get_item(self, item_id):
+
+        """
+        Retrieves an item from the index, and adds it if it doesn't exist yet.
+
+        Arguments:
+        item_id		--	The item id.
+
+        Returns:
+        A zoteroItem.
+        """
+
+        self.check_unpublished()
+        if item_id not in self.items:
+            self.items[item_id] = zoteroItem(item_id,
+                                             noteProvider=self.noteProvider)
+        return self.items[item_id]
+
+    def remove_item(self, item_id):
+
+        """
+        Removes an item from the index, and from the collection, tag and
+        search indexes.
+
+        Arguments:
+        item_id		--	The item id.
+        """
+
+        self.check_unpublished()
+        item = self.items.pop(item_id, None)
+        if item is None:
+            return
+        self.ngrams.remove(item)
+        for values, index in ((item.collections, self.collection_index),
+                              (item.tags, self.tag_index)):
+            for value in values:
+                index[value] -= 1
+                if index[value] == 0:
+                    del index[value]
@@ -18,6 +18,8 @@
 
 #
 
+from sys import intern
+
 term_collection = None, u"collection"
 term_tag = None, u"tag"
 term_author = None, u"author"
@@ -28,13 +30,42 @@ term_title = None, u"title"
 term_doi = None, u"doi"
 term_abstract = None, u'abs'
 
-cache = {}
+# The searchable fields, with the term types that search them
+search_fields = {
+    u"collection": term_collection,
+    u"tag": term_tag,
+    u"author": term_author,
+    u"editor": term_editor,
+    u"date": term_date,
+    u"publication": term_publication,
+    u"title": term_title,
+    u"doi": term_doi,
+    u"abstract": term_abstract,
+}
+
+# The term types, with the fields that they search
+term_fields = {}
+for field, term_types in search_fields.items():
+    for term_type in term_types:
+        term_fields.setdefault(term_type, set()).add(field)
+
+# Values that many items share are interned, so that they are stored once
+shared_fields = u"tag", u"collection", u"author", u"editor", u"date", \
+    u"publication"
 
 
 class zoteroItem(object):
 
     """Represents a single zotero item."""
 
+    # Items have no __dict__, which makes them much smaller in large libraries
+    __slots__ = (u"id", u"key", u"title", u"authors", u"editors", u"date",
+                 u"publication", u"volume", u"issue", u"doi", u"url",
+                 u"abstract", u"collections", u"tags", u"fulltext",
+                 u"search_keys", u"noteProvider", u"note", u"formats")
+
+    collection_color = u"#000000"
+
     def __init__(self, item=None, noteProvider=None):
 
         """
@@ -46,12 +77,13 @@ class zoteroItem(object):
         noteProvider	--	A noteProvider object. (default=None)
         """
 
-        self.gnotero_format_str = None
-        self.html_format_str = None
-        self.simple_format_str = None
-        self.filename_format_str = None
-        self.collection_color = u"#000000"
+        # The formatted representations are created when they are first
+        # needed
+        self.formats = None
         self.noteProvider = noteProvider
+        # The note is -1 until it is looked up, and then a (generation, note)
+        # tuple, which is out of date once the noteProvider has a new
+        # generation
         self.note = -1
         if isinstance(item, dict):
             # TODO: Add the information like bookTitle, programTitle, etc. It seems that this code is not used
@@ -135,6 +167,42 @@ class zoteroItem(object):
                 self.id = item
             else:
                 self.id = None
+        self.update_search_keys()
+
+    def __getstate__(self):
+
+        """
+        Returns:
+        The state of the item for pickling. The noteProvider, the note and
+        the formatted representations are reset.
+        """
+
+        state = {attribute: getattr(self, attribute)
+                 for attribute in self.__slots__}
+        state[u"noteProvider"] = None
+        state[u"note"] = -1
+        state[u"formats"] = None
+        return None, state
+
+    def compact(self):
+
+        """
+        Converts the lists that were filled while indexing the item into
+        tuples, interns the values that are shared with other items, and
+        computes the search keys. This needs to be called whenever the item
+        has been (re-)indexed.
+        """
+
+        self.authors = tuple(intern(author) for author in self.authors)
+        self.editors = tuple(intern(editor) for editor in self.editors or ())
+        self.collections = tuple(intern(collection)
+                                 for collection in self.collections)
+        self.tags = tuple(intern(tag) for tag in self.tags)
+        if self.date is not None:
+            self.date = intern(self.date)
+        if self.publication is not None:
+            self.publication = intern(self.publication)
+        self.update_search_keys()
 
     def match(self, terms):
 
@@ -148,52 +216,117 @@ class zoteroItem(object):
         True if the current item matches the terms, False otherwise.
         """
 
-        global term_collection, term_author, term_title, term_date, \
-            term_publication, term_tag
         # Nothing to search
         if len(terms) == 0:
             return False
         # Walk through all search terms
         for term_type, term in terms:
-            match = False
-            # Do at least one criteria match?
-            if term_type in term_tag:
-                for tag in self.tags:
-                    if term in tag.lower():
-                        match = True
-            if term_type in term_collection:
-                for collection in self.collections:
-                    if term in collection.lower():
-                        match = True
-            if not match and term_type in term_author:
-                for author in self.authors:
-                    if term in author.lower():
-                        match = True
-            if not match and term_type in term_editor:
-                for editor in self.editors:
-                    if term in editor.lower():
-                        match = True
-            if not match and self.date is not None and term_type in term_date:
-                if term in self.date:
-                    match = True
-            if not match and self.title is not None and term_type in \
-                    term_title and term in self.title.lower():
-                match = True
-            if not match and self.publication is not None and term_type in \
-                    term_publication and term in self.publication.lower():
-                match = True
-            if not match and self.doi is not None and term_type in \
-                    term_doi and term in self.doi.lower():
-                match = True
-            if not match and self.abstract is not None and term_type in \
-                    term_abstract and term in self.abstract.lower():
-                match = True
-            # If not return false, otherwise continue
-            if not match:
+            fields = term_fields.get(term_type, ())
+            # Do at least one criteria match? If not return false, otherwise
+            # continue
+            for field, key in self.search_keys:
+                if field in fields and term in key:
+                    break
+            else:
                 return False
         # If we reach this code, all the criteria matched
         return True
 
+    def update_search_keys(self):
+
+        """
+        Computes the case-folded values that search terms are matched
+        against. This needs to be called whenever the item has changed.
+        """
+
+        search_keys = []
+        for field, values in ((u"tag", self.tags),
+                              (u"collection", self.collections),
+                              (u"author", self.authors),
+                              (u"editor", self.editors),
+                              (u"date", (self.date,)),
+                              (u"title", (self.title,)),
+                              (u"publication", (self.publication,)),
+                              (u"doi", (self.doi,)),
+                              (u"abstract", (self.abstract,))):
+            for value in values or ():
+                if value is None:
+                    continue
+                key = value.casefold()
+                # Don't store values twice if they are already case-folded
+                if key == value:
+                    key = value
+                elif field in shared_fields:
+                    key = intern(key)
+                search_keys.append((field, key))
+        self.search_keys = tuple(search_keys)
+
+    def search_values(self):
+
+        """
+        Returns:
+        A sequence of (field, value) tuples with the case-folded searchable
+        values of the item, as computed by update_search_keys().
+        """
+
+        return self.search_keys
+
+    def as_dict(self):
+
+        """
+        Returns:
+        A dict with the information of the item, which can be serialized as
+        JSON.
+        """
+
+        return {
+            u"id": self.id,
+            u"key": self.key,
+            u"title": self.title,
+            u"authors": list(self.authors),
+            u"editors": list(self.editors or ()),
+            u"date": self.date,
+            u"publication": self.publication,
+            u"volume": self.volume,
+            u"issue": self.issue,
+            u"doi": self.doi,
+            u"url": self.url,
+            u"abstract": self.abstract,
+            u"tags": list(self.tags),
+            u"collections": list(self.collections),
+            u"attachments": list(self.fulltext or ()),
+            u"reference": self.full_format(),
+        }
+
+    @classmethod
+    def from_dict(cls, info, noteProvider=None):
+
+        """
+        Creates an item from the information returned by as_dict(), for
+        example by another process.
+
+        Arguments:
+        info			--	A dict with item information.
+
+        Keyword arguments:
+        noteProvider	--	A noteProvider object. (default=None)
+
+        Returns:
+        A zoteroItem.
+        """
+
+        item = cls(info[u"id"], noteProvider=noteProvider)
+        for attribute in (u"key", u"title", u"date", u"publication",
+                          u"volume", u"issue", u"doi", u"url", u"abstract"):
+            setattr(item, attribute, info.get(attribute))
+        item.authors = info.get(u"authors", [])
+        item.editors = info.get(u"editors", [])
+        item.tags = info.get(u"tags", [])
+        item.collections = info.get(u"collections", [])
+        item.fulltext = info.get(u"attachments", [])
+        item.compact()
+        return item
+
     def get_note(self):
 
         """
@@ -203,14 +336,30 @@ class zoteroItem(object):
         A note for the current item.
         """
 
-        if self.note != -1:
-            return self.note
         # Return None if noteProvider is not defined
-        if self.noteProvider is not None:
-            self.note = self.noteProvider.search(self)
-            return self.note
-        else:
+        if self.noteProvider is None:
+            return None
+        if self.note != -1 and self.note[0] == self.noteProvider.generation:
+            return self.note[1]
+        note = self.noteProvider.search(self)
+        self.note = self.noteProvider.generation, note
+        return note
+
+    def has_note(self):
+
+        """
+        Checks whether the item has a note, without looking it up.
+
+        Returns:
+        True if the item has a note, False if it doesn't, or None if the note
+        has not been looked up yet, or the notes have changed since.
+        """
+
+        if self.noteProvider is None:
+            return False
+        if self.note == -1 or self.note[0] != self.noteProvider.generation:
             return None
+        return self.note[1] is not None
 
     def format_author(self):
 
@@ -271,6 +420,17 @@ class zoteroItem(object):
 
         return u", ".join(self.tags)
 
+    def get_formats(self):
+
+        """
+        Returns:
+        A dict in which formatted representations of the item are cached.
+        """
+
+        if self.formats is None:
+            self.formats = {}
+        return self.formats
+
     def gnotero_format(self):
 
         """
@@ -279,7 +439,8 @@ class zoteroItem(object):
         label in Qnotero.
         """
 
-        if self.gnotero_format_str is None:
+        formats = self.get_formats()
+        if u"gnotero" not in formats:
             s =  u"<b>" + self.format_author() + u" " + self.format_date() + \
                 u"</b>"
             if self.title is not None:
@@ -292,8 +453,8 @@ class zoteroItem(object):
                 if self.issue is not None:
                     s += u"(%s)" % self.issue
             s += u"</small>"
-            self.gnotero_format_str = s.replace(u"&", u"&amp;")
-        return self.gnotero_format_str
+            formats[u"gnotero"] = s.replace(u"&", u"&amp;")
+        return formats[u"gnotero"]
 
     def author_date_format(self):
         """
@@ -309,7 +470,8 @@ class zoteroItem(object):
         A pretty, extensive representation of the current item.
         """
 
-        if self.gnotero_format_str is None:
+        formats = self.get_formats()
+        if u"full" not in formats:
             s = self.author_date_format()
             if self.title is not None:
                 s += u"\n" + self.title
@@ -323,8 +485,8 @@ class zoteroItem(object):
                 s += u"\n"
             if self.tags is not None:
                 s += u"\n" + self.format_tags()
-            self.gnotero_format_str = s
-        return self.gnotero_format_str
+            formats[u"full"] = s
+        return formats[u"full"]
 
     def full_formatHTML(self):
 
@@ -332,7 +494,8 @@ class zoteroItem(object):
         Returns:
         A pretty, extensive representation of the current item in HTML format
         """
-        if self.html_format_str is None:
+        formats = self.get_formats()
+        if u"html" not in formats:
             s = u"<b>"
             s += self.author_date_format() + u"</b>"
             if self.title is not None:
@@ -347,8 +510,8 @@ class zoteroItem(object):
                 s += u"<br/>"
             if self.tags is not None:
                 s += u"<br/><b><small>" + self.format_tags() + u"</small></b>"
-            self.html_format_str = s
-        return self.html_format_str
+            formats[u"html"] = s
+        return formats[u"html"]
 
     def simple_format(self):
 
@@ -357,10 +520,11 @@ class zoteroItem(object):
         A pretty, simple representation of the current item.
         """
 
-        if self.simple_format_str is None:
-            self.simple_format_str = self.format_author() + u" " + \
+        formats = self.get_formats()
+        if u"simple" not in formats:
+            formats[u"simple"] = self.format_author() + u" " + \
                 self.format_date()
-        return self.simple_format_str
+        return formats[u"simple"]
 
     def filename_format(self):
 
@@ -369,19 +533,8 @@ class zoteroItem(object):
         A pretty filename format representation of the current item.
         """
 
-        if self.filename_format_str is None:
-            self.filename_format_str = self.format_author() + u" " + \
+        formats = self.get_formats()
+        if u"filename" not in formats:
+            formats[u"filename"] = self.format_author() + u" " + \
                 self.format_date().replace(u"\\", u"")
-        return self.filename_format_str
-
-    def hashKey(self):
-
-        """
-        Returns:
-        A hash representation of the current object.
-        """
-
-        global cache
-        hashKey = str(self)
-        cache[hashKey] = self
-        return hashKey
+        return formats[u"filename"]
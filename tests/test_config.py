@@ -0,0 +1,76 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+
+import unittest
+from unittest import mock
+from libqnotero import config
+
+
+class Settings(dict):
+
+	"""Stores values as strings, like QSettings does on Linux and Windows"""
+
+	def value(self, setting, default):
+
+		return self.get(setting, default)
+
+	def setValue(self, setting, value):
+
+		if isinstance(value, bool):
+			value = u"true" if value else u"false"
+		self[setting] = str(value)
+
+
+class ConfigTest(unittest.TestCase):
+
+	"""Restores settings that have been stored, and those that haven't"""
+
+	def setUp(self):
+
+		patch = mock.patch.dict(config.config)
+		patch.start()
+		self.addCleanup(patch.stop)
+
+	@mock.patch(u"platform.system", return_value=u"Linux")
+	def test_defaults(self, system):
+
+		defaults = config.config.copy()
+		config.restoreConfig(Settings())
+		for setting in (u"indexCache", u"rankResults", u"watchDatabase",
+			u"showAbstract", u"maxResults"):
+			self.assertEqual(config.getConfig(setting), defaults[setting])
+
+	@mock.patch(u"platform.system", return_value=u"Linux")
+	def test_round_trip(self, system):
+
+		settings = Settings()
+		config.setConfig(u"indexCache", False)
+		config.setConfig(u"showAbstract", True)
+		config.saveConfig(settings)
+		config.setConfig(u"indexCache", True)
+		config.setConfig(u"showAbstract", False)
+		config.restoreConfig(settings)
+		self.assertFalse(config.getConfig(u"indexCache"))
+		self.assertTrue(config.getConfig(u"showAbstract"))
+		self.assertTrue(config.getConfig(u"rankResults"))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,110 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+from libzotero._noteProvider.gnoteProvider import GnoteProvider
+from libzotero.zotero_item import zoteroItem
+
+note = u"""<?xml version="1.0" encoding="utf-8"?>
+<note version="0.3" xmlns="http://beatniksoftware.com/tomboy">
+<title>Reading notes</title>
+<text xml:space="preserve"><note-content version="0.1">Reading notes
+
+<bold>%s</bold>
+The note about the paper.
+</note-content></text>
+</note>
+"""
+
+
+class GnoteProviderTest(unittest.TestCase):
+
+	"""Finds Gnote notes by the first author and the year of an item"""
+
+	def setUp(self):
+
+		self.home = tempfile.TemporaryDirectory()
+		self.folder = os.path.join(self.home.name, u".local", u"share",
+			u"gnote")
+		os.makedirs(self.folder)
+		with mock.patch.dict(os.environ, {u"HOME": self.home.name}):
+			self.provider = GnoteProvider(None)
+
+	def tearDown(self):
+
+		self.home.cleanup()
+
+	def write(self, heading):
+
+		with open(os.path.join(self.folder, u"note.note"), u"w",
+			encoding=u"utf-8") as fd:
+			fd.write(note % heading)
+
+	def item(self, author, date):
+
+		item = zoteroItem(1)
+		item.authors = [author]
+		item.date = date
+		return item
+
+	def test_key(self):
+
+		self.assertEqual(self.provider.key(u"Smith, J. (2001)", u"2001"),
+			(u"smith", u"2001"))
+		self.assertEqual(self.provider.key(u"Smith et al. (2001)", u"2001"),
+			(u"smith", u"2001"))
+		self.assertIsNone(self.provider.key(u"(2001)", u"2001"))
+
+	def test_heading(self):
+
+		self.write(u"Smith et al. (2001)")
+		self.assertIsNotNone(self.provider.search(self.item(u"Smith",
+			u"2001")))
+
+	def test_comma_heading(self):
+
+		self.write(u"Smith, J. (2001). A paper")
+		found = self.provider.search(self.item(u"Smith", u"2001"))
+		self.assertIsNotNone(found)
+		self.assertIn(u"The note about the paper.", found.preview)
+		self.assertIsNone(self.provider.search(self.item(u"Smith", u"2002")))
+		self.assertIsNone(self.provider.search(self.item(u"Jones", u"2001")))
+
+	def test_changed_note(self):
+
+		item = self.item(u"Smith", u"2001")
+		item.noteProvider = self.provider
+		self.write(u"Jones (2001)")
+		self.assertIsNone(item.get_note())
+		self.assertIs(item.has_note(), False)
+		self.write(u"Smith (2001)")
+		# Notes are checked for changes at most every refreshInterval seconds
+		self.provider.lastRefresh = 0
+		self.provider.refresh()
+		self.assertIsNone(item.has_note())
+		self.assertIsNotNone(item.get_note())
+		self.assertIs(item.has_note(), True)
+
+
+if __name__ == u"__main__":
+	unittest.main()
@@ -0,0 +1,176 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+
+import glob
+import os
+import unittest
+from unittest import mock
+from libqnotero import config
+from libzotero.libzotero import LibZotero, parse_query
+from tests.zotero import ZoteroTestCase
+
+queries = u"quantum", u"abs:quantum", u"abs:ne", u"smith", u"neural net", \
+	u"title:brain author:jones", u"tag:tag-m", u"year:2001", u"mül"
+
+
+class LibZoteroTest(ZoteroTestCase):
+
+	"""Searches a synthetic database"""
+
+	settings = {u"indexCache": True, u"rankResults": False}
+
+	def zotero(self):
+
+		"""
+		Returns:
+		A LibZotero for the database, which is updated explicitly
+		"""
+
+		return LibZotero(self.zotero_path, autoUpdate=False)
+
+	def expected(self, zotero, query):
+
+		"""
+		Returns:
+		The ids of the indexed items that match a query, without using the
+		n-gram or the full-text index
+		"""
+
+		terms = parse_query(query)
+		return sorted(item.id for item in zotero.zotero_index.items.values()
+			if item.match(terms))
+
+	def assertSearches(self, zotero):
+
+		for query in queries:
+			self.assertEqual([item.id for item in
+				zotero.search_results(query)], self.expected(zotero, query),
+				query)
+
+	def snapshot(self, zotero):
+
+		"""
+		Returns:
+		The indexed information, for comparing indices
+		"""
+
+		index = zotero.zotero_index
+		items = {item_id: (item.key, item.title, item.date,
+			tuple(item.authors), tuple(item.tags), tuple(item.collections),
+			tuple(item.fulltext or ()), item.abstract, item.publication,
+			item.doi) for item_id, item in index.items.items()}
+		return items, index.collection_index, index.tag_index
+
+	def test_search(self):
+
+		zotero = self.zotero()
+		self.assertTrue(zotero.update())
+		self.assertEqual(len(zotero.zotero_index.items), 300)
+		self.assertSearches(zotero)
+
+	def test_incremental(self):
+
+		"""An incremental update gives the same index as a full update"""
+
+		zotero = self.zotero()
+		self.assertTrue(zotero.update())
+		self.database.modify()
+		with mock.patch.object(zotero, u"update_full",
+			side_effect=AssertionError):
+			self.assertTrue(zotero.update())
+		full = self.zotero()
+		self.assertTrue(full.update(force=True))
+		self.assertEqual(self.snapshot(zotero), self.snapshot(full))
+		self.assertEqual(zotero.zotero_index.mtime, full.zotero_index.mtime)
+		self.assertSearches(zotero)
+
+	def test_refine(self):
+
+		"""Queries that refine the previous query search its results"""
+
+		zotero = self.zotero()
+		self.assertTrue(zotero.update())
+		self.assertEqual([item.id for item in zotero.search_results(u"b")],
+			self.expected(zotero, u"b"))
+		with mock.patch.object(zotero, u"search_index",
+			side_effect=AssertionError):
+			for query in u"br", u"bra", u"brain", u"brain m", u"brain mo", \
+				u"brain model":
+				self.assertEqual([item.id for item in
+					zotero.search_results(query)],
+					self.expected(zotero, query), query)
+
+	def test_cache(self):
+
+		"""An index that is loaded from the cache equals the one stored"""
+
+		zotero = self.zotero()
+		self.assertTrue(zotero.update())
+		cached = self.zotero()
+		self.assertIsNot(cached.zotero_index, zotero.zotero_index)
+		self.assertEqual(self.snapshot(cached), self.snapshot(zotero))
+		self.assertEqual(cached.zotero_index.mtime, zotero.zotero_index.mtime)
+		with mock.patch.object(cached, u"update_full",
+			side_effect=AssertionError):
+			self.assertTrue(cached.update())
+		self.assertSearches(cached)
+		# The next update only re-indexes what changed since
+		self.database.modify()
+		cached = self.zotero()
+		with mock.patch.object(cached, u"update_full",
+			side_effect=AssertionError):
+			self.assertTrue(cached.update())
+		full = self.zotero()
+		self.assertTrue(full.update(force=True))
+		self.assertEqual(self.snapshot(cached), self.snapshot(full))
+
+	def test_relative_path(self):
+
+		cwd = os.getcwd()
+		os.chdir(self.folder.name)
+		self.addCleanup(os.chdir, cwd)
+		for mode in u"readonly", u"immutable", u"auto":
+			with mock.patch.dict(config.config,
+				{u"zoteroDatabaseMode": mode}):
+				zotero = LibZotero(u"Zotero", autoUpdate=False)
+				self.assertTrue(zotero.update(force=True))
+				self.assertSearches(zotero)
+
+	def test_lost_fulltext_index(self):
+
+		"""
+		A full-text index that is lost while the index is cached is rebuilt,
+		also if the database changed in the meantime
+		"""
+
+		self.assertTrue(self.zotero().update())
+		for path in glob.glob(os.path.join(self.folder.name, u"config",
+			u"Qnotero", u"search-*")):
+			os.remove(path)
+		self.database.modify()
+		zotero = self.zotero()
+		zotero.update()
+		self.assertEqual(zotero.fts.mtime(), zotero.zotero_index.mtime)
+		self.assertSearches(zotero)
+		self.assertSearches(self.zotero())
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,74 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+
+import unittest
+from unittest import mock
+from libqnotero import config
+from libzotero.libzotero import LibZotero
+from tests.zotero import ZoteroTestCase
+
+queries = u"quantum", u"brain model", u"abs:noise signal", u"smith", \
+	u"tag:tag-m", u"year:20", u"j", u"journal"
+
+
+class RankingTest(ZoteroTestCase):
+
+	"""Ranks the results of searches in a synthetic database"""
+
+	settings = {u"indexCache": False, u"rankResults": True}
+
+	def setUp(self):
+
+		ZoteroTestCase.setUp(self)
+		self.zotero = LibZotero(self.zotero_path, autoUpdate=False)
+		self.assertTrue(self.zotero.update())
+
+	def ranked(self, query, max_results):
+
+		return [item.id for item in self.zotero.search_results(query,
+			max_results=max_results)]
+
+	def test_top(self):
+
+		"""The best results are the first ones of the full ranking"""
+
+		for query in queries:
+			ranked = self.ranked(query, 0)
+			for max_results in 1, 5, 20, 100:
+				results = self.zotero.search_results(query,
+					max_results=max_results)
+				self.assertEqual([item.id for item in results],
+					ranked[:max_results], (query, max_results))
+				self.assertEqual(results.matches, len(ranked))
+
+	def test_unranked(self):
+
+		"""Ranking orders the results, but doesn't change them"""
+
+		for query in queries:
+			ranked = self.ranked(query, 0)
+			with mock.patch.dict(config.config, {u"rankResults": False}):
+				unranked = self.ranked(query, 0)
+			self.assertEqual(sorted(ranked), unranked, query)
+			self.assertTrue(ranked)
+
+
+if __name__ == '__main__':
+	unittest.main()
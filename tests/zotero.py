@@ -0,0 +1,244 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+
+"""A small synthetic Zotero database, with the tables that Qnotero reads"""
+
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import unittest
+from unittest import mock
+from libqnotero import config
+
+schema = u"""
+	create table itemTypes (itemTypeID integer primary key, typeName text);
+	create table fields (fieldID integer primary key, fieldName text);
+	create table items (itemID integer primary key, itemTypeID int,
+		dateAdded timestamp default current_timestamp,
+		dateModified timestamp default current_timestamp,
+		clientDateModified timestamp default current_timestamp,
+		libraryID int default 1, key text, version int default 0);
+	create table itemDataValues (valueID integer primary key, value unique);
+	create table itemData (itemID int, fieldID int, valueID int,
+		primary key (itemID, fieldID));
+	create table creators (creatorID integer primary key, firstName text,
+		lastName text, fieldMode int);
+	create table creatorTypes (creatorTypeID integer primary key,
+		creatorType text);
+	create table itemCreators (itemID int, creatorID int, creatorTypeID int,
+		orderIndex int, primary key (itemID, orderIndex));
+	create table collections (collectionID integer primary key,
+		collectionName text, parentCollectionID int,
+		clientDateModified timestamp default current_timestamp,
+		libraryID int default 1, key text);
+	create table collectionItems (collectionID int, itemID int,
+		orderIndex int default 0, primary key (collectionID, itemID));
+	create table tags (tagID integer primary key, name text unique);
+	create table itemTags (itemID int, tagID int, type int,
+		primary key (itemID, tagID));
+	create table itemAttachments (itemID integer primary key,
+		parentItemID int, linkMode int, contentType text, charsetID int,
+		path text, syncState int default 0);
+	create table deletedItems (itemID integer primary key,
+		dateDeleted default current_timestamp);
+	create table retractedItems (itemID integer primary key, data text,
+		flag int default 0);
+	create table fulltextWords (wordID integer primary key, word text unique);
+	create table fulltextItemWords (wordID int, itemID int,
+		primary key (wordID, itemID));
+	"""
+
+fields = u"title", u"abstractNote", u"date", u"publicationTitle", \
+	u"volume", u"DOI"
+
+words = (u"model neural network quantum brain memory attention visual "
+	u"cortex learning bayesian inference dynamics signal noise decision "
+	u"reward language speech motor control perception").split()
+
+names = (u"Smith Jones Duhamel Mathôt Theeuwes Albiter Dareau Nguyen Garcia "
+	u"Müller").split()
+
+
+class Database(object):
+
+	"""Builds and modifies a synthetic Zotero database"""
+
+	def __init__(self, path, count=300, seed=1):
+
+		"""
+		Constructor
+
+		Arguments:
+		path -- the path of the database
+		count -- the number of items
+		seed -- the seed for the random contents
+		"""
+
+		self.path = path
+		self.random = random.Random(seed)
+		self.next_id = 1
+		conn = sqlite3.connect(path)
+		conn.executescript(schema)
+		conn.executemany(u"insert into itemTypes values (?, ?)",
+			[(1, u"attachment"), (2, u"journalArticle")])
+		conn.executemany(u"insert into fields values (?, ?)",
+			list(enumerate(fields, 1)))
+		conn.executemany(u"insert into creatorTypes values (?, ?)",
+			[(1, u"author"), (2, u"editor")])
+		conn.executemany(u"insert into creators values (?, ?, ?, 0)",
+			[(i, u"A", name) for i, name in enumerate(names, 1)])
+		conn.executemany(u"insert into collections (collectionID, "
+			u"collectionName, key) values (?, ?, ?)",
+			[(i, u"Collection %d" % i, u"C%07d" % i) for i in range(1, 6)])
+		conn.executemany(u"insert into tags values (?, ?)",
+			[(i, u"tag-%s" % word) for i, word in enumerate(words, 1)])
+		conn.executemany(u"insert into fulltextWords values (?, ?)",
+			[(i, word) for i, word in enumerate(words, 1)])
+		for i in range(count):
+			self.add(conn)
+		conn.commit()
+		conn.close()
+
+	def text(self, count):
+
+		"""
+		Returns:
+		A string of random words
+		"""
+
+		return u" ".join(self.random.choice(words) for i in range(count))
+
+	def value(self, conn, item_id, field, value):
+
+		"""Sets a field of an item"""
+
+		conn.execute(u"insert or ignore into itemDataValues (value) "
+			u"values (?)", (value,))
+		conn.execute(u"insert or replace into itemData values (?, ?, "
+			u"(select valueID from itemDataValues where value = ?))",
+			(item_id, fields.index(field) + 1, value))
+
+	def add(self, conn):
+
+		"""
+		Adds an item with random contents, and sometimes an attachment
+
+		Returns:
+		The id of the item
+		"""
+
+		item_id = self.next_id
+		self.next_id += 1
+		conn.execute(u"insert into items (itemID, itemTypeID, key) "
+			u"values (?, 2, ?)", (item_id, u"K%07d" % item_id))
+		self.value(conn, item_id, u"title", self.text(6).capitalize())
+		self.value(conn, item_id, u"abstractNote", self.text(40))
+		self.value(conn, item_id, u"date",
+			u"%d-01-01" % self.random.randint(1990, 2020))
+		self.value(conn, item_id, u"publicationTitle",
+			u"Journal of %s" % self.random.choice(words).title())
+		self.value(conn, item_id, u"DOI", u"10.1000/%d" % item_id)
+		for order in range(self.random.randint(1, 3)):
+			conn.execute(u"insert into itemCreators values (?, ?, 1, ?)",
+				(item_id, self.random.randint(1, len(names)), order))
+		for collection in self.random.sample(range(1, 6),
+			self.random.randint(0, 2)):
+			conn.execute(u"insert into collectionItems (collectionID, "
+				u"itemID) values (?, ?)", (collection, item_id))
+		for tag in self.random.sample(range(1, len(words) + 1),
+			self.random.randint(0, 3)):
+			conn.execute(u"insert into itemTags values (?, ?, 0)",
+				(item_id, tag))
+		if self.random.random() < .5:
+			attachment_id = self.next_id
+			self.next_id += 1
+			conn.execute(u"insert into items (itemID, itemTypeID, key) "
+				u"values (?, 1, ?)", (attachment_id, u"K%07d" % attachment_id))
+			conn.execute(u"insert into itemAttachments values (?, ?, 0, "
+				u"'application/pdf', null, 'storage:paper.pdf', 0)",
+				(attachment_id, item_id))
+			for word in self.random.sample(range(1, len(words) + 1), 5):
+				conn.execute(u"insert into fulltextItemWords values (?, ?)",
+					(word, attachment_id))
+		return item_id
+
+	def modify(self, count=20):
+
+		"""
+		Adds, changes, trashes and removes items, and moves the modification
+		time of the database ahead, so that the change is noticed
+
+		Arguments:
+		count -- the number of items of each kind of change
+		"""
+
+		conn = sqlite3.connect(self.path)
+		item_ids = [row[0] for row in conn.execute(
+			u"select itemID from items where itemTypeID = 2")]
+		changed = self.random.sample(item_ids, count * 3)
+		for item_id in changed[:count]:
+			self.value(conn, item_id, u"title", self.text(6).capitalize())
+			self.value(conn, item_id, u"abstractNote", self.text(40))
+			conn.execute(u"update items set version = version + 1 "
+				u"where itemID = ?", (item_id,))
+		for item_id in changed[count:count * 2]:
+			conn.execute(u"insert into deletedItems (itemID) values (?)",
+				(item_id,))
+		for item_id in changed[count * 2:]:
+			conn.execute(u"delete from items where itemID = ?", (item_id,))
+		for i in range(count):
+			self.add(conn)
+		conn.commit()
+		conn.close()
+		mtime = time.time() + 10
+		os.utime(self.path, (mtime, mtime))
+
+
+class ZoteroTestCase(unittest.TestCase):
+
+	"""
+	Runs a test with a synthetic Zotero database, and with the configuration
+	folder and the settings in a temporary folder
+	"""
+
+	settings = {}
+
+	def setUp(self):
+
+		self.folder = tempfile.TemporaryDirectory()
+		self.zotero_path = os.path.join(self.folder.name, u"Zotero")
+		os.makedirs(self.zotero_path)
+		self.database = Database(os.path.join(self.zotero_path,
+			u"zotero.sqlite"))
+		patches = [
+			mock.patch.dict(os.environ, {u"HOME": self.folder.name,
+				u"XDG_CONFIG_HOME": os.path.join(self.folder.name,
+				u"config")}),
+			mock.patch.dict(config.config, self.settings)
+			]
+		for patch in patches:
+			patch.start()
+			self.addCleanup(patch.stop)
+
+	def tearDown(self):
+
+		self.folder.cleanup()